@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmarks of the hot paths of the framework.
+
+Usage: python Benchmark.py [name ...]
+Without a name all benchmarks are run.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+
+# One BLAS thread per process, the data-parallel benchmark scales over
+# processes. Has to be set before numpy is imported.
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import numpy as np
+
+from data.data_set import DataSet
+from model.mlp import MultilayerPerceptron
+from serving.server import InferenceServer
+from util.activation_functions import Activation
+
+
+def _elementwiseActivations():
+    # The former implementations building python lists element by element,
+    # kept as a reference to measure the speedup against
+    return {
+        'relu': lambda x: np.asarray([max(0.00, i) for i in x]),
+        'lrelu': lambda x: np.asarray([max(0.01*i, i) for i in x]),
+        'lreluPrime': lambda x: np.asarray([1.0 if o > 0 else 0.01
+                                            for o in x]),
+        'softmax': lambda x: (lambda e: e / np.sum(e))(
+            [np.exp(o - np.max(x)) for o in x]),
+        'sigmoid': lambda x: 1/(1+np.exp(-1.0*x)),
+        'tanh': lambda x: (lambda p, n: np.divide(p-n, p+n))(
+            np.exp(1.0*x), np.exp(-1.0*x)),
+    }
+
+
+def benchmarkActivations(batchSize=32, width=512, number=200):
+    """
+    Compare the former per-sample activations with the vectorized ones,
+    allocating and in place (out=), on a (batchSize, width) batch
+    """
+    rns = np.random.RandomState(42)
+    batch = rns.uniform(-3, 3, size=(batchSize, width))
+    buffer = np.empty_like(batch)
+
+    kernels = {
+        'relu': Activation.rectified,
+        'lrelu': Activation.leakyRectified,
+        'lreluPrime': Activation.leakyRectifiedPrime,
+        'softmax': Activation.softmax,
+        'sigmoid': Activation.sigmoid,
+        'tanh': Activation.tanh,
+    }
+    references = _elementwiseActivations()
+
+    print("Activations on a ({0}, {1}) batch, time per call:"
+          .format(batchSize, width))
+    print("{0:>12} {1:>12} {2:>12} {3:>12} {4:>9}"
+          .format("activation", "per sample", "vectorized", "out=",
+                  "speedup"))
+
+    for name in sorted(kernels):
+        kernel = kernels[name]
+        reference = references[name]
+
+        # The references only handle vectors, so loop over the rows
+        tReference = timeit.timeit(
+            lambda: [reference(row) for row in batch],
+            number=max(1, number // 20)) / max(1, number // 20)
+        tVectorized = timeit.timeit(lambda: kernel(batch),
+                                    number=number) / number
+        tInPlace = timeit.timeit(lambda: kernel(batch, out=buffer),
+                                 number=number) / number
+
+        print("{0:>12} {1:>10.1f}us {2:>10.1f}us {3:>10.1f}us {4:>8.1f}x"
+              .format(name, tReference * 1e6, tVectorized * 1e6,
+                      tInPlace * 1e6, tReference / tInPlace))
+
+
+def _syntheticDataSet(numSamples, rns, dtype=np.float32):
+    return DataSet.fromArrays(rns.uniform(size=(numSamples, 784))
+                              .astype(dtype),
+                              rns.randint(10, size=numSamples),
+                              oneHot=False)
+
+
+def benchmarkDataParallel(numSamples=20000, layers=[512, 256, 128],
+                          batchSize=256, epochs=2, workers=(1, 2, 4, 8)):
+    """
+    Training throughput of a MultilayerPerceptron for different numbers of
+    data-parallel workers, in both modes
+    """
+    rns = np.random.RandomState(42)
+    trainingSet = _syntheticDataSet(numSamples, rns)
+    validationSet = _syntheticDataSet(100, rns)
+
+    print("Data-parallel training of a {0} MLP, batch size {1}, {2} samples:"
+          .format(layers, batchSize, numSamples))
+    print("{0:>8} {1:>8} {2:>14} {3:>9}"
+          .format("mode", "workers", "samples/s", "speedup"))
+
+    for mode in ['sync', 'hogwild']:
+        baseline = None
+        for numWorkers in workers:
+            mlp = MultilayerPerceptron(trainingSet, validationSet,
+                                       validationSet, layers=layers,
+                                       inputActivation='lrelu',
+                                       loss='crossentropy',
+                                       learningRate=0.01,
+                                       batchSize=batchSize, epochs=epochs,
+                                       earlyStoppingEpochs=epochs,
+                                       monitorTrainingSize=100,
+                                       numWorkers=numWorkers,
+                                       parallelMode=mode)
+
+            start = time.time()
+            mlp.train(verbose=False)
+            throughput = numSamples * epochs / (time.time() - start)
+            baseline = baseline or throughput
+
+            print("{0:>8} {1:>8} {2:>14.0f} {3:>8.2f}x"
+                  .format(mode, numWorkers, throughput,
+                          throughput / baseline))
+
+
+def benchmarkBatchPipeline(numSamples=20000, layers=[512, 256, 128],
+                           batchSize=128, epochs=2):
+    """
+    Training throughput of a MultilayerPerceptron with the batches prepared
+    in the training loop and by the background batch pipeline
+    """
+    rns = np.random.RandomState(42)
+    trainingSet = _syntheticDataSet(numSamples, rns)
+    validationSet = _syntheticDataSet(100, rns)
+
+    print("Batch pipeline, {0} MLP, batch size {1}, {2} samples:"
+          .format(layers, batchSize, numSamples))
+    print("{0:>10} {1:>14}".format("pipeline", "samples/s"))
+
+    for batchPipeline in [False, True]:
+        mlp = MultilayerPerceptron(trainingSet, validationSet, validationSet,
+                                   layers=layers, inputActivation='lrelu',
+                                   loss='crossentropy', learningRate=0.01,
+                                   batchSize=batchSize, epochs=epochs,
+                                   earlyStoppingEpochs=epochs,
+                                   monitorTrainingSize=100,
+                                   batchPipeline=batchPipeline)
+
+        start = time.time()
+        mlp.train(verbose=False)
+        print("{0:>10} {1:>14.0f}"
+              .format(str(batchPipeline),
+                      numSamples * epochs / (time.time() - start)))
+
+
+async def _generateLoad(port, inputs, numClients, numRequests):
+    """
+    Send numRequests requests from each of numClients keep-alive
+    connections, returns the client-side latencies in seconds
+    """
+    async def client(rank):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        latencies = []
+        for i in range(numRequests):
+            row = inputs[(rank * numRequests + i) % len(inputs)]
+            body = json.dumps({'inputs': [row.tolist()]}).encode('utf-8')
+
+            start = time.time()
+            writer.write('POST /predict HTTP/1.1\r\n'
+                         'Content-Length: {0}\r\n\r\n'
+                         .format(len(body)).encode('latin-1') + body)
+            await writer.drain()
+
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.time() - start)
+
+        writer.close()
+        return latencies
+
+    results = await asyncio.gather(*[client(rank)
+                                     for rank in range(numClients)])
+    return [latency for latencies in results for latency in latencies]
+
+
+def benchmarkServing(layers=[128], clients=(1, 8, 32), numRequests=200,
+                     maxWaits=(0.0, 0.002)):
+    """
+    Latency and throughput of the inference server under a local load
+    generator, for different numbers of concurrent clients and batching
+    windows
+    """
+    rns = np.random.RandomState(42)
+    dataSet = _syntheticDataSet(100, rns)
+    mlp = MultilayerPerceptron(dataSet, dataSet, dataSet, layers=layers,
+                               inputActivation='lrelu', loss='crossentropy',
+                               monitorTrainingSize=100)
+
+    print("Serving a {0} MLP, single-row requests:".format(layers))
+    print("{0:>8} {1:>8} {2:>12} {3:>10} {4:>10} {5:>11}"
+          .format("wait ms", "clients", "requests/s", "p50 ms", "p99 ms",
+                  "batch rows"))
+
+    async def run(maxWait, numClients):
+        server = InferenceServer(mlp, maxBatchSize=64, maxWait=maxWait)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+
+        start = time.time()
+        latencies = await _generateLoad(port, dataSet.input, numClients,
+                                        numRequests)
+        elapsed = time.time() - start
+        stats = server.batcher.stats.getStats()
+        await server.close()
+
+        latencies = np.asarray(latencies) * 1000
+        print("{0:>8.1f} {1:>8} {2:>12.0f} {3:>10.2f} {4:>10.2f} {5:>11.1f}"
+              .format(maxWait * 1000, numClients, len(latencies) / elapsed,
+                      np.percentile(latencies, 50),
+                      np.percentile(latencies, 99), stats['meanBatchRows']))
+
+    for maxWait in maxWaits:
+        for numClients in clients:
+            asyncio.run(run(maxWait, numClients))
+
+
+BENCHMARKS = {
+    'activations': benchmarkActivations,
+    'pipeline': benchmarkBatchPipeline,
+    'dataparallel': benchmarkDataParallel,
+    'serving': benchmarkServing,
+}
+
+
+def main(names):
+    for name in names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
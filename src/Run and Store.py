@@ -2,56 +2,82 @@
 # -*- coding: utf-8 -*-
 
 from data.mnist_seven import MNISTSeven
+from data.shared_data import createSharedDirectory, removeSharedDirectory
+from data.shared_data import publishDataSet, attachDataSet
 from model.stupid_recognizer import StupidRecognizer
 from model.perceptron import Perceptron
 from model.logistic_regression import LogisticRegression
 from model.mlp import MultilayerPerceptron
+from model.serialization import saveModel
+from model.quantization import quantize, quantizationReport
+from processing.sweep import SuccessiveHalving, gridConfigurations
 
 from report.evaluator import Evaluator
 from report.performance_plot import PerformancePlot
 
 import os
 
-from joblib import Parallel, delayed
-import multiprocessing
-
 
 def main():
     if not os.path.exists("../plots"):
         os.makedirs("../plots")
 
-    numCores = 8
-    Parallel(n_jobs=numCores)(delayed(process)(learningRate, weightDecayRate)
-                              for learningRate in [0.0025, 0.005, 0.01, 0.02,
-                                                   0.04, 0.08, 0.16]
-                              for weightDecayRate in [0.000001, 0.000002,
-                                                      0.000004, 0.000008,
-                                                      0.000016, 0.000032,
-                                                      0.000064, 0.000128,
-                                                      0.000256, 0.000512])
-
-def process(learningRate, weightDecayRate):
+    # Load and normalize the data once, the jobs attach to it read-only
     data = MNISTSeven("../data/mnist_seven.csv", 3000, 1000, 1000,
                       oneHot=False)
-    myMLP = MultilayerPerceptron(data.trainingSet,
-                                 data.validationSet,
-                                 data.testSet,
-                                 learningRate=learningRate,
-                                 weightDecayRate=weightDecayRate,
-                                 epochs=500 ,
-                                 loss='crossentropy',
+    sharedDirectory = createSharedDirectory()
+
+    try:
+        sharedData = [publishDataSet(data.trainingSet, sharedDirectory,
+                                     'train'),
+                      publishDataSet(data.validationSet, sharedDirectory,
+                                     'valid'),
+                      publishDataSet(data.testSet, sharedDirectory, 'test')]
+
+        configurations = gridConfigurations(
+            learningRate=[0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16],
+            weightDecayRate=[0.000001, 0.000002, 0.000004, 0.000008,
+                             0.000016, 0.000032, 0.000064, 0.000128,
+                             0.000256, 0.000512])
+        for configuration in configurations:
+            configuration.update(loss='crossentropy',
                                  outputActivation='softmax')
+
+        # Configurations which are clearly worse than the others after a
+        # few epochs are not trained any further
+        numCores = 8
+        sweep = SuccessiveHalving(sharedData, configurations,
+                                  "../checkpoints", "../plots/sweep.csv",
+                                  minEpochs=20, maxEpochs=500,
+                                  reductionFactor=3, numWorkers=numCores)
+        best = sweep.run()
+
+        process(sharedData, best,
+                sweep.getCheckpointDir(best['configuration']))
+    finally:
+        removeSharedDirectory(sharedDirectory)
+
+def process(sharedData, best, checkpointDir):
+    trainingSet, validationSet, testSet = map(attachDataSet, sharedData)
+    # The sweep has trained the configuration already, resuming from its
+    # checkpoint only restores the best weights
+    myMLP = MultilayerPerceptron(trainingSet,
+                                 validationSet,
+                                 testSet,
+                                 learningRate=best['learningRate'],
+                                 weightDecayRate=best['weightDecayRate'],
+                                 epochs=best['epochs'],
+                                 loss=best['loss'],
+                                 outputActivation=best['outputActivation'],
+                                 checkpointDir=checkpointDir,
+                                 resume=True)
     # Report the result #
     print("=========================")
     evaluator = Evaluator()
 
-    # Train the classifiers
-    print("=========================")
-    print("Training..")
-
-    print("\nMLP has been training..")
+    print("Best configuration: learning rate {0}, weight decay rate {1}"
+          .format(best['learningRate'], best['weightDecayRate']))
     myMLP.train()
-    print("Done..")
 
     # Do the recognizer
     # Explicitly specify the test set to be evaluated
@@ -60,22 +86,33 @@ def process(learningRate, weightDecayRate):
     # lrPred = myLRClassifier.evaluate()
     MLPPred = myMLP.evaluate()
 
+    # Store the best network, e.g. to serve it with serving/server.py
+    saveModel(myMLP, os.path.join(checkpointDir, "best.model"))
+
 
     # Report the result
     print("=========================")
     evaluator = Evaluator()
 
     print("Result of the mlp recognizer:")
-    #evaluator.printComparison(data.testSet, MLPPred)
-    evaluator.printAccuracy(data.testSet, MLPPred)
+    #evaluator.printComparison(testSet, MLPPred)
+    evaluator.printAccuracy(testSet, MLPPred)
+
+    # int8 inference model, calibrated on the validation set
+    report = quantizationReport(myMLP, quantize(myMLP), testSet)
+    print("Accuracy of the int8 mlp: {0:.2f}% ({1:+.2f}%), "
+          "{2} instead of {3} bytes"
+          .format(report['quantizedAccuracy'] * 100,
+                  report['accuracyDelta'] * 100,
+                  report['quantizedBytes'], report['floatBytes']))
 
     # Draw
     plot = PerformancePlot("MLP validation")
     plot.draw_performance_epoch(myMLP.performancesTraining,
                                 myMLP.performancesValidation,
-                                myMLP.epochs,
-                                learningRate,
-                                weightDecayRate)
+                                myMLP.monitoredEpochs,
+                                best['learningRate'],
+                                best['weightDecayRate'])
 
 if __name__ == '__main__':
     main()
@@ -55,7 +55,8 @@ def main():
     # Draw
     plot = PerformancePlot("MLP validation")
     plot.draw_performance_epoch(myMLP.performancesTraining,
-                                myMLP.performancesValidation, myMLP.epochs)
+                                myMLP.performancesValidation,
+                                myMLP.monitoredEpochs)
     
     
 if __name__ == '__main__':
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+Double-buffered mini-batch pipeline for in-memory data sets.
+
+A background thread gathers the next shuffled batch (inputs and one-hot
+targets) into a preallocated buffer while the training loop works on the
+current one. numpy releases the GIL while copying and in the BLAS calls of
+the training, so preparing and training a batch really overlap. The buffers
+are reused for every batch, no memory is allocated per batch.
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+
+class BatchPipeline(object):
+    """
+    Prepare shuffled, one-hot encoded, contiguous batches in the background
+
+    Parameters
+    ----------
+    dataSet : DataSet
+        in-memory data set with integer labels
+    batchSize : positive int
+    numOutputs : positive int
+        width of the one-hot targets, i.e. the size of the output layer
+    dtype : numpy dtype
+        type of the input and target buffers, defaults to the input type
+    shuffle : bool
+        visit the samples in a new random order every epoch
+    numBuffers : int
+        number of batch buffers, 2 is double buffering: one batch is
+        trained on while the next one is prepared
+
+    Attributes
+    ----------
+    inputBuffers : list of ndarray
+        (batchSize, nIn) input buffers
+    targetBuffers : list of ndarray
+        (batchSize, numOutputs) one-hot target buffers
+    """
+
+    def __init__(self, dataSet, batchSize, numOutputs, dtype=None,
+                 shuffle=True, numBuffers=2):
+        dtype = np.dtype(dtype if dtype is not None else dataSet.input.dtype)
+        self.input = dataSet.input
+        self.targets = dataSet.getTargets(numOutputs, dtype)
+        self.batchSize = batchSize
+        self.shuffle = shuffle
+
+        self.inputBuffers = [np.empty((batchSize, self.input.shape[1]),
+                                      dtype) for _ in range(numBuffers)]
+        self.targetBuffers = [np.empty((batchSize, numOutputs), dtype)
+                              for _ in range(numBuffers)]
+        # inputs of another type are gathered here and then converted,
+        # np.take would otherwise convert through a temporary
+        self._gatherBuffer = None
+        if self.input.dtype != dtype:
+            self._gatherBuffer = np.empty((batchSize, self.input.shape[1]),
+                                          self.input.dtype)
+
+    def iterBatches(self, rns=None):
+        """
+        Yield the (inputs, targets) batches of one epoch
+
+        The arrays are views of the reused buffers: a batch is only valid
+        until the next one is requested.
+
+        Parameters
+        ----------
+        rns : RandomState
+            source of the shuffling, np.random by default
+        """
+        numSamples = len(self.input)
+        if self.shuffle:
+            order = (rns or np.random).permutation(numSamples)
+        else:
+            order = np.arange(numSamples)
+
+        free = queue.Queue()
+        ready = queue.Queue()
+        for index in range(len(self.inputBuffers)):
+            free.put(index)
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for start in range(0, numSamples, self.batchSize):
+                    index = free.get()
+                    if stopped.is_set():
+                        return
+                    size = self._fill(index, order[start:start +
+                                                   self.batchSize])
+                    ready.put((index, size))
+                ready.put(None)
+            except BaseException as e:
+                ready.put(e)
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        previous = None
+        try:
+            while True:
+                item = ready.get()
+                # the consumer is done with the previous batch
+                if previous is not None:
+                    free.put(previous)
+                    previous = None
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+
+                index, size = item
+                previous = index
+                yield (self.inputBuffers[index][:size],
+                       self.targetBuffers[index][:size])
+        finally:
+            stopped.set()
+            free.put(None)
+            producer.join()
+
+    def _fill(self, index, indices):
+        """Gather the samples at indices into the buffers of index"""
+        size = len(indices)
+        # the indices come from our own permutation, so they are never out
+        # of bounds; 'clip' skips the check, with the default 'raise' numpy
+        # would gather through a temporary of the size of the batch
+        if self._gatherBuffer is None:
+            np.take(self.input, indices, axis=0, mode='clip',
+                    out=self.inputBuffers[index][:size])
+        else:
+            np.take(self.input, indices, axis=0, mode='clip',
+                    out=self._gatherBuffer[:size])
+            np.copyto(self.inputBuffers[index][:size],
+                      self._gatherBuffer[:size], casting='same_kind')
+        # rows of the cached one-hot target matrix of the data set
+        np.take(self.targets, indices, axis=0, mode='clip',
+                out=self.targetBuffers[index][:size])
+        return size
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Binary cache for the CSV data files.
+
+Parsing a CSV with np.genfromtxt takes seconds, so the parsed uint8 matrix
+is stored next to the CSV as a .npy file once. The cache file name contains
+the size and modification time of the CSV, a changed CSV therefore gets a
+new cache. The cache is memory-mapped read-only, parallel processes loading
+the same data share the same page cache pages.
+"""
+
+import glob
+import os
+import re
+
+import numpy as np
+
+from util.files import atomicWrite
+
+
+def cachePath(dataPath):
+    """Returns the path of the binary cache belonging to the current CSV"""
+    stat = os.stat(dataPath)
+    return "{0}.{1}-{2}.npy".format(dataPath, stat.st_size,
+                                    stat.st_mtime_ns)
+
+
+def loadCSV(dataPath, cache=True):
+    """
+    Load a CSV file with delimiter ',' and uint8 values
+
+    Parameters
+    ----------
+    dataPath : string
+        Path to the CSV file.
+    cache : bool
+        Use (and create if needed) the binary cache of the file.
+
+    Returns
+    -------
+    ndarray :
+        the uint8 data matrix, a read-only memory map if it is cached
+    """
+    if not cache:
+        return np.genfromtxt(dataPath, delimiter=",", dtype="uint8")
+
+    path = cachePath(dataPath)
+    if not os.path.exists(path):
+        data = np.genfromtxt(dataPath, delimiter=",", dtype="uint8")
+        try:
+            atomicWrite(path, lambda f: np.save(f, data))
+        except OSError:
+            # e.g. a read-only data directory, simply go without cache
+            return data
+        _remove_stale_caches(dataPath, path)
+
+    try:
+        return np.load(path, mmap_mode='r')
+    except OSError:
+        # e.g. a cache written by another user without read permission
+        return np.genfromtxt(dataPath, delimiter=",", dtype="uint8")
+
+
+def _remove_stale_caches(dataPath, currentPath):
+    # only names cachePath creates (<csv>.<size>-<mtime_ns>.npy), other
+    # .npy files next to the CSV are left alone
+    pattern = re.compile(re.escape(dataPath) + r"\.\d+-\d+\.npy\Z")
+    for path in glob.glob(glob.escape(dataPath) + ".*-*.npy"):
+        if pattern.match(path) and path != currentPath:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
+
+# Labels are small class indices, a signed type keeps differences such as
+# label - prediction correct
+LABEL_DTYPE = np.int16
+
 
 class DataSet(object):
     """
@@ -13,31 +19,105 @@ class DataSet(object):
         be transformed to False and `targetDigit` bill be transformed to True.
     targetDigit : string
         Label of the dataset, e.g. '7'.
+    dtype : numpy dtype
+        Floating point type of the normalized input, e.g. np.float32.
 
     Attributes
     ----------
-    input : list
-    label : list
-        A labels for the data given in `input`.
+    input : ndarray
+    label : ndarray
+        The labels for the data given in `input`, as LABEL_DTYPE integers.
     oneHot : bool
     targetDigit : string
     """
 
-    def __init__(self, data, oneHot=True, targetDigit='7'):
+    def __init__(self, data, oneHot=True, targetDigit='7', dtype=np.float64):
 
         # The label of the digits is always the first fields
         # Doing normalization
-        self.input = (1.0 * data[:, 1:])/255
-        self.label = data[:, 0]
+        self.input = data[:, 1:].astype(dtype)
+        self.input /= 255
         self.oneHot = oneHot
         self.targetDigit = targetDigit
 
         # Transform all labels which is not the targetDigit to False,
         # The label of targetDigit will be True,
         if oneHot:
-            self.label = list(map(lambda a: 1 
-                            if str(a) == targetDigit else 0, 
-                            self.label))
+            self.label = (data[:, 0] == int(targetDigit)).astype(LABEL_DTYPE)
+        else:
+            self.label = data[:, 0].astype(LABEL_DTYPE)
+
+        self._targets = None
+
+    @classmethod
+    def fromArrays(cls, input, label, oneHot=True, targetDigit='7'):
+        """
+        Create a data set from already normalized inputs and (transformed)
+        labels, the arrays are used as they are, without copying.
+        """
+        dataSet = cls.__new__(cls)
+        dataSet.input = input
+        dataSet.label = label
+        dataSet.oneHot = oneHot
+        dataSet.targetDigit = targetDigit
+        dataSet._targets = None
+        return dataSet
+
+    @property
+    def dtype(self):
+        return self.input.dtype
+
+    @property
+    def numInputs(self):
+        return self.input.shape[1]
+
+    def __len__(self):
+        return len(self.input)
+
+    def getTargets(self, numOutputs, dtype=np.float64):
+        """
+        Returns the (n, numOutputs) one-hot target matrix of the labels
+
+        The matrix is built on first use and cached, training slices it
+        instead of encoding the labels of every batch again.
+        """
+        dtype = np.dtype(dtype)
+        if (self._targets is None or
+                self._targets.shape[1] != numOutputs or
+                self._targets.dtype != dtype):
+            labels = np.asarray(self.label)
+            self._targets = np.zeros((len(labels), numOutputs), dtype)
+            self._targets[np.arange(len(labels)), labels] = 1
+        return self._targets
+
+    def iterBatches(self, batchSize, numOutputs=None, dtype=np.float64):
+        """
+        Yield the (input, label) mini-batches of one epoch in order, the
+        same interface as data.streaming.StreamingDataSet
+
+        The inputs are of type dtype, copied only if the set holds another
+        type. With numOutputs the one-hot targets (see getTargets) are
+        yielded instead of the labels.
+        """
+        if numOutputs is None:
+            labels = np.asarray(self.label)
+        else:
+            labels = self.getTargets(numOutputs, dtype)
+        for start in range(0, len(labels), batchSize):
+            end = start + batchSize
+            yield (self.input[start:end].astype(dtype, copy=False),
+                   labels[start:end])
+
+    def sample(self, size):
+        """
+        Returns the inputs and labels of a fixed random subset of size rows
+        (sorted), or of all rows if size is None or not smaller
+        """
+        if size is None or size >= len(self.input):
+            return self.input, np.asarray(self.label)
+        indices = np.sort(np.random.choice(len(self.input), size,
+                                           replace=False))
+        return self.input[indices], np.asarray(self.label)[indices]
 
     def __iter__(self):
         return self.input.__iter__()
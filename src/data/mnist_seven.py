@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from numpy.random import shuffle
+from numpy.random import permutation
+from data.cache import loadCSV
 from data.data_set import DataSet
 
 
@@ -25,6 +26,11 @@ class MNISTSeven(object):
         Set it to False for full MNIST task
     targetDigit : string
         Label of the dataset, e.g. '7'.
+    cache : bool
+        Keep a binary copy of the parsed CSV next to it and load that one
+        (memory-mapped) as long as the CSV does not change.
+    dtype : numpy dtype
+        Floating point type of the normalized inputs, e.g. np.float32.
 
     Attributes
     ----------
@@ -40,28 +46,33 @@ class MNISTSeven(object):
                         numValid=1000,
                         numTest=1000,
                         oneHot=True,
-                        targetDigit='7'):
+                        targetDigit='7',
+                        cache=True,
+                        dtype=np.float64):
 
         self.trainingSet = []
         self.validationSet = []
         self.testSet = []
 
-        self.load(dataPath, numTrain, numValid, numTest, oneHot, targetDigit)
+        self.load(dataPath, numTrain, numValid, numTest, oneHot, targetDigit,
+                  cache, dtype)
 
-    def load(self, dataPath, numTrain, numValid, numTest, oneHot, targetDigit):
+    def load(self, dataPath, numTrain, numValid, numTest, oneHot, targetDigit,
+             cache=True, dtype=np.float64):
         """Load the data."""
         print("Loading data from " + dataPath + "...")
 
-        data = np.genfromtxt(dataPath, delimiter=",", dtype="uint8")
+        data = loadCSV(dataPath, cache)
 
         # The last numTest instances ALWAYS comprise the test set.
         train, test = data[:numTrain+numValid], data[numTrain+numValid:]
-        shuffle(train)
+        # The cached data is read-only, shuffle into a copy
+        train = train[permutation(len(train))]
 
         train, valid = train[:numTrain], train[numTrain:]
 
-        self.trainingSet = DataSet(train, oneHot, targetDigit)
-        self.validationSet = DataSet(valid, oneHot, targetDigit)
-        self.testSet = DataSet(test, oneHot, targetDigit)
+        self.trainingSet = DataSet(train, oneHot, targetDigit, dtype)
+        self.validationSet = DataSet(valid, oneHot, targetDigit, dtype)
+        self.testSet = DataSet(test, oneHot, targetDigit, dtype)
 
         print("Data loaded.")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sharing data sets between processes.
+
+The parent process loads and normalizes the data once and publishes the
+arrays as .npy files (in /dev/shm if available). Worker processes attach to
+them as read-only memory maps, so all of them share the same physical pages
+instead of holding their own copies.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from data.data_set import DataSet
+
+
+def createSharedDirectory():
+    """Create a directory to publish data sets in, preferably in RAM"""
+    shm = '/dev/shm'
+    return tempfile.mkdtemp(prefix='nnpraktikum-',
+                            dir=shm if os.path.isdir(shm) else None)
+
+
+def removeSharedDirectory(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def publishDataSet(dataSet, directory, name):
+    """
+    Write the arrays of a data set to `directory`
+
+    Parameters
+    ----------
+    dataSet : DataSet
+    directory : string
+        e.g. created with createSharedDirectory
+    name : string
+        unique name of the data set within the directory
+
+    Returns
+    -------
+    dict :
+        a small, picklable description to be passed to attachDataSet
+    """
+    inputPath = os.path.join(directory, name + '-input.npy')
+    labelPath = os.path.join(directory, name + '-label.npy')
+    np.save(inputPath, np.ascontiguousarray(dataSet.input))
+    np.save(labelPath, np.asarray(dataSet.label))
+
+    return {'input': inputPath,
+            'label': labelPath,
+            'oneHot': dataSet.oneHot,
+            'targetDigit': dataSet.targetDigit}
+
+
+def attachDataSet(description):
+    """
+    Memory-map a published data set read-only
+
+    Returns
+    -------
+    DataSet :
+        a data set whose arrays are read-only views of the shared files
+    """
+    return DataSet.fromArrays(np.load(description['input'], mmap_mode='r'),
+                              np.load(description['label'], mmap_mode='r'),
+                              description['oneHot'],
+                              description['targetDigit'])
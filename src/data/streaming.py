@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+Out-of-core training set streaming shuffled mini-batches from disk.
+
+The rows (label first, then the uint8 pixels, like the MNIST CSV files) are
+read chunk by chunk into a bounded shuffle buffer, shuffled there and handed
+out as normalized mini-batches. A background thread reads and prepares the
+next batches while the current one is trained on. Memory use only depends on
+the buffer sizes, never on the size of the file.
+
+Two sources are supported:
+
+CSV file
+    parsed chunk by chunk (slow, re-parsed every epoch)
+.npy file
+    a 2-D uint8 array as written by np.save, e.g. the cache of
+    data.cache.loadCSV; the rows are read as raw bytes, without parsing
+"""
+
+import itertools
+import queue
+import threading
+
+import numpy as np
+
+from data.data_set import LABEL_DTYPE
+
+
+class StreamingDataSet(object):
+    """
+    A training set too large for memory, read from disk every epoch
+
+    Parameters
+    ----------
+    path : string
+        CSV file with delimiter ',' or .npy file with uint8 values
+    start : int
+        first row of the file belonging to the set
+    stop : int
+        row after the last one belonging to the set, None for the end of the
+        file; start and stop split one file into e.g. training and test set
+    oneHot : bool
+        transform the labels to 1 for targetDigit and 0 otherwise, see
+        DataSet
+    targetDigit : string
+    dtype : numpy dtype
+        floating point type of the normalized inputs
+    shuffleBufferSize : positive int
+        number of rows shuffled together; rows further apart in the file
+        than this are never swapped
+    chunkSize : positive int
+        number of rows read from the file at once
+    prefetch : positive int
+        number of batches prepared ahead by the background thread
+    seed : int
+        seed of the shuffling, None for a random one
+
+    Attributes
+    ----------
+    numInputs : positive int
+        number of inputs (pixels) of a row
+    dtype : numpy dtype
+    oneHot : bool
+    targetDigit : string
+    """
+
+    def __init__(self, path, start=0, stop=None, oneHot=True,
+                 targetDigit='7', dtype=np.float64, shuffleBufferSize=10000,
+                 chunkSize=1000, prefetch=2, seed=None):
+        self.path = path
+        self.start = start
+        self.stop = stop
+        self.oneHot = oneHot
+        self.targetDigit = targetDigit
+        self.dtype = np.dtype(dtype)
+        self.shuffleBufferSize = shuffleBufferSize
+        self.chunkSize = chunkSize
+        self.prefetch = prefetch
+
+        self._rns = np.random.RandomState(seed)
+        self._numSamples = None
+
+        self.binary = path.endswith('.npy')
+        if self.binary:
+            with open(path, 'rb') as f:
+                self._rowCount, self._rowWidth, self._dataOffset = \
+                    self._read_npy_header(f)
+        else:
+            with open(path, 'rb') as f:
+                firstLine = f.readline()
+            self._rowWidth = firstLine.count(b',') + 1
+
+        self.numInputs = self._rowWidth - 1
+
+    def __len__(self):
+        # counting the rows of a CSV needs one pass over the file
+        if self._numSamples is None:
+            if self.binary:
+                total = self._rowCount
+            else:
+                with open(self.path, 'rb') as f:
+                    total = sum(1 for _ in f)
+            stop = total if self.stop is None else min(self.stop, total)
+            self._numSamples = max(0, stop - self.start)
+        return self._numSamples
+
+    def iterBatches(self, batchSize, numOutputs=None, dtype=np.float64):
+        """
+        Yield the shuffled (input, label) mini-batches of one epoch
+
+        The input is a (batchSize, numInputs) matrix of normalized values of
+        type dtype, the label a vector of integers, or with numOutputs the
+        one-hot (batchSize, numOutputs) targets; only the last batch may be
+        smaller.
+        The batches are prepared by a background thread.
+        """
+        batches = queue.Queue(maxsize=self.prefetch)
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for input, label in self._generate_batches(batchSize):
+                    input = input.astype(dtype, copy=False)
+                    if numOutputs is not None:
+                        targets = np.zeros((len(label), numOutputs), dtype)
+                        targets[np.arange(len(label)), label] = 1
+                        label = targets
+                    batch = input, label
+                    while not stopped.is_set():
+                        try:
+                            batches.put(batch, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stopped.is_set():
+                        return
+                batches.put(None)
+            except BaseException as e:
+                batches.put(e)
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # the consumer may stop early, e.g. on an exception
+            stopped.set()
+            producer.join()
+
+    def sample(self, size):
+        """
+        Returns the inputs and labels of the first size rows, e.g. to
+        estimate the training accuracy on
+        """
+        if size is None:
+            size = len(self)
+        numChunks = (size + self.chunkSize - 1) // self.chunkSize
+        # the readers reuse their chunk array
+        rows = [chunk.copy() for chunk in
+                itertools.islice(self._read_chunks(), numChunks)]
+        if not rows:
+            return self._prepare(np.empty((0, self._rowWidth), np.uint8))
+        return self._prepare(np.concatenate(rows)[:size])
+
+    def _prepare(self, rows):
+        """Normalized input and (transformed) labels of raw uint8 rows"""
+        input = rows[:, 1:].astype(self.dtype)
+        input /= 255
+        if self.oneHot:
+            label = (rows[:, 0] == int(self.targetDigit)).astype(LABEL_DTYPE)
+        else:
+            label = rows[:, 0].astype(LABEL_DTYPE)
+        return input, label
+
+    def _generate_batches(self, batchSize):
+        """
+        Shuffle the rows in a bounded buffer and yield prepared batches
+
+        Whenever the buffer is full it is shuffled and all but the first
+        half (rounded to whole batches) are handed out, the kept half is
+        mixed with the next rows.
+        """
+        capacity = max(self.shuffleBufferSize, batchSize)
+        buffer = np.empty((capacity + self.chunkSize, self._rowWidth),
+                          np.uint8)
+        keep = capacity // 2
+        count = 0
+
+        for chunk in self._read_chunks():
+            buffer[count:count + len(chunk)] = chunk
+            count += len(chunk)
+            if count < capacity:
+                continue
+
+            buffer[:count] = buffer[self._rns.permutation(count)]
+            numOut = (count - keep) // batchSize * batchSize
+            for end in range(count, count - numOut, -batchSize):
+                yield self._prepare(buffer[end - batchSize:end])
+            count -= numOut
+
+        buffer[:count] = buffer[self._rns.permutation(count)]
+        for start in range(0, count, batchSize):
+            yield self._prepare(buffer[start:min(start + batchSize, count)])
+
+    def _read_chunks(self):
+        """Yield the rows of the set chunk by chunk"""
+        if self.binary:
+            return self._read_npy_chunks()
+        return self._read_csv_chunks()
+
+    def _read_npy_chunks(self):
+        stop = self._rowCount if self.stop is None else \
+            min(self.stop, self._rowCount)
+        chunk = np.empty((self.chunkSize, self._rowWidth), np.uint8)
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._dataOffset + self.start * self._rowWidth)
+            for start in range(self.start, stop, self.chunkSize):
+                numRows = min(self.chunkSize, stop - start)
+                view = chunk[:numRows]
+                if f.readinto(memoryview(view).cast('B')) != view.nbytes:
+                    raise IOError(self.path + ' is truncated')
+                yield view
+
+    def _read_csv_chunks(self):
+        with open(self.path, 'rb') as f:
+            lines = itertools.islice(f, self.start, self.stop)
+            while True:
+                block = list(itertools.islice(lines, self.chunkSize))
+                if not block:
+                    break
+                yield np.loadtxt(block, delimiter=',', dtype=np.uint8,
+                                 ndmin=2)
+
+    @staticmethod
+    def _read_npy_header(f):
+        """Returns rows, columns and data offset of an uint8 .npy file"""
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortranOrder, dtype = header
+        if dtype != np.uint8 or len(shape) != 2 or fortranOrder:
+            raise ValueError(f.name + ' has to hold a 2-D C-order uint8 '
+                             'array')
+        return shape[0], shape[1], f.tell()
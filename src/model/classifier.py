@@ -19,6 +19,11 @@ class Classifier:
         # classify an instance given the model of the classifier
         pass
 
+    @abstractmethod
+    def predict(self, testInputs):
+        # classify a whole matrix of instances (one per row) at once
+        pass
+
     @abstractmethod
     def evaluate(self, test):
         # evaluate a whole test set given the model of the classifier
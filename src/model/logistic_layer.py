@@ -2,7 +2,8 @@ import time
 
 import numpy as np
 
-from util.activation_functions import Activation
+from util.activation_functions import getActivationFunction
+from util.optimizers import SGD
 
 
 class LogisticLayer():
@@ -15,6 +16,8 @@ class LogisticLayer():
     nOut: int: number of units of the current layer (or output)
     activation: string: activation function of every units in the layer
     isClassifierLayer: bool:  to do classification or regression
+    dtype: numpy dtype: type of randomly initialized weights, given weights
+        keep their own type
 
     Attributes
     ----------
@@ -23,37 +26,44 @@ class LogisticLayer():
     nOut : positive int:
         number of units of the current layer
     weights : ndarray
-        weight matrix
-    activation : functional
-        activation function
+        weight matrix, the first row holds the bias weights
+    activation : ActivationFunction
+        activation function, keeps what its derivative needs from the last
+        forward pass
     activationString : string
         the name of the activation function
     isClassifierLayer: bool
         to do classification or regression
     deltas : ndarray
         partial derivatives
+    gradient : ndarray
+        gradient of the loss w.r.t. the weights, computed by computeGradient
+    optimizerState : dict
+        buffers of the optimizer updating the weights
     size : positive int
         number of units in the current layer
     shape : tuple
         shape of the layer, is also shape of the weight matrix
+    dtype : numpy dtype
+        type of the weights
     """
 
     def __init__(self, nIn, nOut, weights=None,
-                 activation='sigmoid', isClassifierLayer=False):
+                 activation='sigmoid', isClassifierLayer=False,
+                 dtype=np.float64):
 
         # Get activation function from string
         self.activationString = activation
-        self.activation = Activation.getActivation(self.activationString)
-        self.activationDerivative = Activation.getDerivative(
-                                    self.activationString)
+        self.activation = getActivationFunction(self.activationString)
 
         self.nIn = nIn
         self.nOut = nOut
 
-        self.inp = np.ndarray((nIn+1, 1))
-        self.inp[0] = 1
-        self.outp = np.ndarray((nOut, 1))
-        self.deltas = np.zeros((nOut, 1))
+        # The bias is not part of the input, it is added from the first row
+        # of the weights, so inputs never have to be copied to prepend a 1
+        self.inp = np.zeros(nIn, dtype)
+        self.outp = np.ndarray((nOut, 1), dtype)
+        self.deltas = np.zeros((nOut, 1), dtype)
 
         # You can have better initialization here
         if weights is None:
@@ -65,12 +75,21 @@ class LogisticLayer():
                 rns = np.random.RandomState(int(time.time()))
                 r = np.sqrt(6.0/(nIn))
                 self.weights = rns.uniform(-r, r,size=(nIn + 1, nOut))
+            self.weights = self.weights.astype(dtype)
         else:
             assert(weights.shape == (nIn + 1, nOut))
             self.weights = weights
 
+        self.dtype = self.weights.dtype
+
         self.isClassifierLayer = isClassifierLayer
 
+        # Buffer for the weight gradient, reused by every update. np.zeros
+        # maps its pages lazily, so layers only used for prediction (e.g.
+        # with memory-mapped weights) do not pay for it
+        self.gradient = np.zeros(self.weights.shape, self.dtype)
+        self.optimizerState = None
+
         # Some handy properties of the layers
         self.size = self.nOut
         self.shape = self.weights.shape
@@ -82,12 +101,15 @@ class LogisticLayer():
         Parameters
         ----------
         inp : ndarray
-            a numpy array (nIn + 1,1) containing the input of the layer
+            a numpy array (nIn,) containing the input of the layer, or a
+            (batch, nIn) matrix holding one input per row
 
         Change outp
         -------
         outp: ndarray
-            a numpy array (nOut,1) containing the output of the layer
+            a numpy array (nOut,) containing the output of the layer, or a
+            (batch, nOut) matrix for a batched input. The array is reused
+            (overwritten) by the next forward pass with the same shape.
         """
 
         # Here you have to implement the forward pass
@@ -129,15 +151,21 @@ class LogisticLayer():
         #                np.dot(next_derivatives, next_weights))
 
         # Or even more general: doesn't care which activation function is used
-        # dado: derivative of activation function w.r.t the output
-        dado = self.activationDerivative(self.outp)
-        mult = np.dot(next_weights, next_derivatives)
-
-        # in case of softmax dado is a matrix
-        if len(dado.shape) > 1:
-            self.deltas = np.dot(dado, mult)
+        if np.ndim(next_weights) == 0:
+            # output layer: next_derivatives is the derivative of the loss
+            # w.r.t the output, copied in the layer type as the backward
+            # pass works in place
+            mult = np.array(next_derivatives, dtype=self.dtype)
+            mult *= next_weights
         else:
-            self.deltas = (dado * mult)
+            # next_derivatives holds one row per sample when training on
+            # batches, so the weights are applied from the right
+            mult = np.dot(next_derivatives, np.transpose(next_weights))
+
+        # the forward pass kept the derivative of the activation (w.r.t the
+        # net input), applying it is a multiplication, for softmax the
+        # product with its jacobian
+        self.deltas = self.activation.backward(mult, out=mult)
 
         # Or you can explicitly calculate the derivatives for two cases
         # Page 40 Back-propagation slides
@@ -151,14 +179,88 @@ class LogisticLayer():
         # the other is computeOutputLayerDerivative or such.
         return self.deltas
 
-    def updateWeights(self, learningRate, weightDecayRate):
+    def computeOutputDerivative(self, target):
+        """
+        Compute the derivatives of an output layer whose activation is fused
+        with the loss, i.e. softmax with cross entropy or sigmoid with binary
+        cross entropy
+
+        For these pairs the derivative of the loss w.r.t. the net input of
+        the layer is simply output - target, so neither the jacobian of the
+        activation nor the division by the output is needed.
+
+        Parameters
+        ----------
+        target: ndarray
+            a numpy array (or matrix for a batch) containing the targets
+
+        Change deltas
+        -------
+        deltas: ndarray
+            a numpy array containing the partial derivatives on this layer
+        """
+        # keep the layer type for integer targets, e.g. the 0/1 labels of
+        # the logistic regression
+        self.deltas = np.subtract(self.outp, target, dtype=self.dtype)
+        return self.deltas
+
+    def computeGradient(self, weightDecayRate=0):
+        """
+        Compute the gradient of the loss w.r.t. the weights from the input
+        and the deltas of the last forward/backward pass
+
+        For a batched forward/backward pass the gradients of all samples are
+        combined into a single matrix product and averaged over the batch.
+
+        Change gradient
+        -------
+        gradient: ndarray
+            a numpy array (nIn + 1, nOut), including the L2 weight decay
+        """
+
+        inp = np.atleast_2d(self.inp)
+        deltas = np.atleast_2d(self.deltas)
+
+        # The bias row sees a constant input of 1
+        gradient = self.gradient
+        np.dot(inp.T, deltas, out=gradient[1:])
+        np.sum(deltas, axis=0, out=gradient[0])
+        gradient /= inp.shape[0]
+
+        if weightDecayRate:
+            gradient += weightDecayRate * self.weights
+
+        return gradient
+
+    def updateWeights(self, learningRate, weightDecayRate, optimizer=None):
         """
         Update the weights of the layer
+
+        Parameters
+        ----------
+        learningRate : float
+        weightDecayRate : float
+        optimizer : Optimizer
+            the update rule, plain gradient descent (SGD) if None
         """
 
-        # weight updating as gradient descent principle
-        self.weights -= learningRate * (self.inp.reshape(-1, 1) * self.deltas.reshape(1, -1) -
-                                        self.weights * weightDecayRate)
+        if optimizer is None:
+            optimizer = SGD()
+        if self.optimizerState is None:
+            self.optimizerState = optimizer.createState(self.weights)
+
+        self.computeGradient(weightDecayRate)
+        optimizer.update(self.weights, self.gradient, self.optimizerState,
+                         learningRate)
 
     def _fire(self, inp):
-        return self.activation(np.dot(inp, self.weights))
+        # Reuse the output buffer of the previous pass if the shape matches,
+        # net input and activation are then computed without allocating
+        shape = np.shape(inp)[:-1] + (self.nOut,)
+        dtype = np.result_type(inp, self.weights)
+        if self.outp.shape != shape or self.outp.dtype != dtype:
+            self.outp = np.empty(shape, dtype)
+
+        np.dot(inp, self.weights[1:], out=self.outp)
+        self.outp += self.weights[0]
+        return self.activation(self.outp, out=self.outp)
@@ -11,6 +11,9 @@ from model.classifier import Classifier
 from model.logistic_layer import LogisticLayer
 
 from util.loss_functions import *
+from util.optimizers import getOptimizer
+from util.learning_rate_schedules import getLearningRateSchedule
+from util.quasi_newton import LBFGS
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                     level=logging.DEBUG,
@@ -24,10 +27,31 @@ class LogisticRegression(Classifier):
     Parameters
     ----------
     train : list
+        None for a model whose layer is set afterwards, e.g. when loading a
+        saved model (see model.serialization)
     valid : list
     test : list
     learningRate : float
     epochs : positive int
+    batchSize : positive int
+        number of instances whose gradients are computed with one matrix
+        product and averaged for an update, 1 is online learning
+    weightDecayRate : float
+        L2 regularization of the weights
+    solver : string
+        'sgd' trains epoch by epoch with the optimizer, 'lbfgs' minimizes
+        the full-batch BCE (plus L2) with L-BFGS, then epochs is the maximal
+        number of L-BFGS iterations (needs loss 'bce')
+    dtype : numpy dtype
+        floating point type of the weights, defaults to the type of the
+        training inputs
+    optimizer : string or Optimizer
+        update rule of the weights, see util.optimizers.getOptimizer
+    learningRateSchedule : string or LearningRateSchedule
+        learning rate of every epoch, see
+        util.learning_rate_schedules.getLearningRateSchedule; the validation
+        performances are recorded when training verbose or if the schedule
+        needs them ('plateau')
 
     Attributes
     ----------
@@ -37,19 +61,34 @@ class LogisticRegression(Classifier):
     learningRate : float
     epochs : positive int
     performances: array of floats
+    convergence : list of dicts
+        diagnostics of every L-BFGS iteration (loss, gradient norm, step
+        length, evaluations), see util.quasi_newton.LBFGS
     """
 
     def __init__(self, train, valid, test, 
                  learningRate=0.01, epochs=50,
-                 loss='bce'):
+                 loss='bce', dtype=None, optimizer='sgd',
+                 learningRateSchedule='constant', batchSize=1,
+                 weightDecayRate=0, solver='sgd'):
 
         self.learningRate = learningRate
         self.epochs = epochs
+        self.batchSize = batchSize
+        self.weightDecayRate = weightDecayRate
+        self.solver = solver
+        self.optimizer = getOptimizer(optimizer)
+        self.learningRateSchedule = getLearningRateSchedule(
+                                    learningRateSchedule)
+        if dtype is None:
+            dtype = train.input.dtype if train is not None else np.float64
+        self.dtype = np.dtype(dtype)
 
         self.trainingSet = train
         self.validationSet = valid
         self.testSet = test
-        
+
+        self.lossString = loss
         if loss == 'bce':
             self.loss = BinaryCrossEntropyError()
         elif loss == 'sse':
@@ -62,24 +101,28 @@ class LogisticRegression(Classifier):
             self.loss = AbsoluteError()
         else:
             raise ValueError('There is no predefined loss function ' +
-                             'named ' + str)
-                             
-        
+                             'named ' + loss)
+
+        if solver not in ('sgd', 'lbfgs'):
+            raise ValueError('Unknown solver: ' + str(solver))
+        if solver == 'lbfgs' and loss != 'bce':
+            raise ValueError('The lbfgs solver minimizes the bce loss')
+
+        # Sigmoid output with bce does not need the activation derivative
+        self.fusedOutput = ('sigmoid', loss) in FUSED_OUTPUT_LOSSES
+
         # Record the performance of each epoch for later usages
         # e.g. plotting, reporting..
         self.performances = []
+        self.convergence = []
 
         # Use a logistic layer as one-neuron classification (output) layer
-        self.layer = LogisticLayer(train.input.shape[1], 1, 
-                                   activation='sigmoid', 
-                                   isClassifierLayer=True)
-
-        # add bias values ("1"s) at the beginning of all data sets
-        self.trainingSet.input = np.insert(self.trainingSet.input, 0, 1,
-                                            axis=1)
-        self.validationSet.input = np.insert(self.validationSet.input, 0, 1,
-                                              axis=1)
-        self.testSet.input = np.insert(self.testSet.input, 0, 1, axis=1)
+        self.layer = None
+        if train is not None:
+            self.layer = LogisticLayer(train.input.shape[1], 1,
+                                       activation='sigmoid',
+                                       isClassifierLayer=True,
+                                       dtype=self.dtype)
 
     def train(self, verbose=True):
         """Train the Logistic Regression.
@@ -90,46 +133,108 @@ class LogisticRegression(Classifier):
             Print logging messages with validation accuracy if verbose is True.
         """
 
+        if self.solver == 'lbfgs':
+            self._train_lbfgs(verbose)
+            return
+
         # Run the training "epochs" times, print out the logs
         for epoch in range(self.epochs):
             if verbose:
                 print("Training epoch {0}/{1}.."
                       .format(epoch + 1, self.epochs))
 
-            self._train_one_epoch()
+            learningRate = self.learningRateSchedule.getLearningRate(
+                self.learningRate, epoch, self.epochs, self.performances)
+            self._train_one_epoch(learningRate)
 
-            if verbose:
+            if verbose or self.learningRateSchedule.needsPerformances:
                 accuracy = accuracy_score(self.validationSet.label,
                                           self.evaluate(self.validationSet))
                 # Record the performance of each epoch for later usages
                 # e.g. plotting, reporting..
                 self.performances.append(accuracy)
+            if verbose:
                 print("Accuracy on validation: {0:.2f}%"
                       .format(accuracy * 100))
                 print("-----------------------------")
 
-    def _train_one_epoch(self):
+    def _train_lbfgs(self, verbose=True):
+        """
+        Minimize the full-batch BCE (plus L2) over the weights with L-BFGS
+        """
+        inputs = self.trainingSet.input
+        targets = np.asarray(self.trainingSet.label)
+
+        def lossAndGradient(weights):
+            # weights[0] is the bias, like the rows of the layer weights
+            netOutput = np.dot(inputs, weights[1:]) + weights[0]
+            # one sample per row, the mean over the samples
+            error, derivative = self.loss.logitErrorAndDerivative(
+                targets[:, np.newaxis], netOutput[:, np.newaxis], 'mean')
+            gradient = np.empty_like(weights)
+            gradient[0] = np.sum(derivative)
+            gradient[1:] = np.dot(derivative[:, 0], inputs)
+            if self.weightDecayRate:
+                error += 0.5 * self.weightDecayRate * np.dot(weights,
+                                                             weights)
+                gradient += self.weightDecayRate * weights
+            return error, gradient
+
+        def report(entry):
+            if verbose:
+                print("Iteration {iteration}: loss {loss:.6f}, gradient "
+                      "{gradientNorm:.2e}, step {step:.2e}, "
+                      "{evaluations} evaluations".format(**entry))
+
+        solver = LBFGS()
+        weights = solver.minimize(lossAndGradient, self.layer.weights[:, 0],
+                                  self.epochs, report)
+        self.layer.weights[:, 0] = weights
+        self.convergence = solver.history
+
+        if verbose:
+            print("L-BFGS stopped after {0} iterations: {1}"
+                  .format(len(solver.history), solver.message))
+            accuracy = accuracy_score(self.validationSet.label,
+                                      self.evaluate(self.validationSet))
+            self.performances.append(accuracy)
+            print("Accuracy on validation: {0:.2f}%"
+                  .format(accuracy * 100))
+
+    def _train_one_epoch(self, learningRate=None):
         """
         Train one epoch, seeing all input instances
         """
+        if learningRate is None:
+            learningRate = self.learningRate
 
-        for img, label in zip(self.trainingSet.input,
-                              self.trainingSet.label):
+        for inputs, labels in self.trainingSet.iterBatches(self.batchSize,
+                                                           dtype=self.dtype):
 
             # Use LogisticLayer to do the job
-            # Feed it with inputs
+            # Feed it with a (batch, nIn) matrix of inputs
 
             # Do a forward pass to calculate the output and the error
-            self.layer.forward(img)
+            self.layer.forward(inputs)
+            targets = labels[:, np.newaxis]
 
             # Compute the derivatives w.r.t to the error
             # Please note the treatment of nextDerivatives and nextWeights
             # in case of an output layer
-            self.layer.computeDerivative(self.loss.calculateDerivative(
-                                         label,self.layer.outp), 1.0)
-
-            # Update weights in the online learning fashion
-            self.layer.updateWeights(self.learningRate)
+            if self.fusedOutput:
+                # sigmoid with bce: the deltas are simply p - y
+                self.layer.computeOutputDerivative(targets)
+            else:
+                # the derivative of every sample on its own (the 'sum'
+                # reduction), computeGradient averages over the batch
+                self.layer.computeDerivative(self.loss.calculateDerivative(
+                                             targets, self.layer.outp,
+                                             'sum'), 1.0)
+
+            # The layer computes the gradient X.T @ deltas of the whole
+            # batch in one product, averages it and adds the weight decay
+            self.layer.updateWeights(learningRate, self.weightDecayRate,
+                                     self.optimizer)
 
     def classify(self, test_instance):
         """Classify a single instance.
@@ -148,28 +253,47 @@ class LogisticRegression(Classifier):
         outp = self.layer.forward(test_instance)
         return outp > 0.5
 
+    def predict_proba(self, testInputs):
+        """Compute the probability of being a 7 for a matrix of instances.
+
+        Parameters
+        ----------
+        testInputs : ndarray
+            a (n, nIn) matrix containing one instance per row
+
+        Returns
+        -------
+        ndarray :
+            the probability of every row of testInputs being a 7
+        """
+        # copy the result as the layer reuses its output buffer
+        return np.array(self.layer.forward(
+            np.asarray(testInputs, dtype=self.dtype))[..., 0])
+
+    def predict(self, testInputs):
+        """Classify a whole matrix of instances.
+
+        Returns
+        -------
+        ndarray :
+            True for every row of testInputs recognized as a 7
+        """
+        return self.predict_proba(testInputs) > 0.5
+
     def evaluate(self, test=None):
         """Evaluate a whole dataset.
 
         Parameters
         ----------
-        test : the dataset to be classified
+        test : the dataset (or its input matrix) to be classified
         if no test data, the test set associated to the classifier will be used
 
         Returns
         -------
-        List:
-            List of classified decisions for the dataset's entries.
+        ndarray:
+            Classified decisions for the dataset's entries.
         """
         if test is None:
             test = self.testSet.input
-        # Once you can classify an instance, just use map for all of the test
-        # set.
-        return list(map(self.classify, test))
-
-    def __del__(self):
-        # Remove the bias from input data
-        self.trainingSet.input = np.delete(self.trainingSet.input, 0, axis=1)
-        self.validationSet.input = np.delete(self.validationSet.input, 0,
-                                              axis=1)
-        self.testSet.input = np.delete(self.testSet.input, 0, axis=1)
+        # A DataSet can be passed directly, classify its input matrix
+        return self.predict(getattr(test, 'input', test))
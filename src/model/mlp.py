@@ -1,9 +1,17 @@
 
+import os
+
 import numpy as np
 
 from util.loss_functions import *
 from model.logistic_layer import LogisticLayer
 from model.classifier import Classifier
+from util.early_stopping import EarlyStopping
+from util.files import atomicWrite
+from util.optimizers import getOptimizer
+from util.learning_rate_schedules import getLearningRateSchedule
+from processing.data_parallel import DataParallelTrainer
+from data.batch_pipeline import BatchPipeline
 
 from sklearn.metrics import accuracy_score
 
@@ -18,14 +26,20 @@ class MultilayerPerceptron(Classifier):
                  outputTask='classification', inputActivation='sigmoid',
                  outputActivation='softmax', loss='bce',
                  learningRate=0.01, weightDecayRate=0, earlyStoppingEpochs=5,
-                 epochs=50):
+                 epochs=50, batchSize=1, dtype=None, earlyStopping=None,
+                 monitorEvery=1, monitorTrainingSize=1000, checkpointDir=None,
+                 checkpointEvery=10, resume=False, optimizer='sgd',
+                 learningRateSchedule='constant', numWorkers=1,
+                 parallelMode='sync', batchPipeline=False):
 
         """
         A MNIST recognizer based on multi-layer perceptron algorithm
 
         Parameters
         ----------
-        train : list
+        train : DataSet or StreamingDataSet
+            None for a model whose layers are set afterwards, e.g. when
+            loading a saved model (see model.serialization)
         valid : list
         test : list
         inputActivation : string
@@ -34,6 +48,45 @@ class MultilayerPerceptron(Classifier):
         weightDecayRate : float
         earlyStopping : positive int
         epochs : positive int
+        batchSize : positive int
+            number of samples propagated through the network at once
+        dtype : numpy dtype
+            floating point type of weights and computations, e.g. np.float32;
+            defaults to the type of the training inputs
+        earlyStopping : EarlyStopping
+            decides when to stop and restores the best weights at the end,
+            by default one with a patience of earlyStoppingEpochs
+        monitorEvery : positive int
+            evaluate the performances only every monitorEvery epochs and
+            after the last epoch, so the early stopping can keep it
+        monitorTrainingSize : positive int
+            size of the random subset of the training set used to estimate
+            the training accuracy, None for the whole training set (a
+            streamed training set uses its first rows, see sample)
+        checkpointDir : string
+            directory to save checkpoints of the training in, None to
+            disable checkpoints
+        checkpointEvery : positive int
+            save a checkpoint every checkpointEvery epochs (and at the end)
+        resume : bool
+            continue the training from the checkpoint in checkpointDir
+        optimizer : string or Optimizer
+            update rule of the weights: 'sgd', 'momentum', 'nesterov',
+            'rmsprop', 'adam' or an Optimizer instance
+        learningRateSchedule : string or LearningRateSchedule
+            learning rate of every epoch based on learningRate: 'constant',
+            'step', 'exponential', 'cosine', 'onecycle', 'plateau' or a
+            LearningRateSchedule instance
+        numWorkers : positive int
+            number of processes to train on data-parallel, 1 trains in the
+            calling process
+        parallelMode : string
+            'sync' (all-reduce of the gradients of every mini-batch) or
+            'hogwild' (lock-free SGD), see processing.data_parallel
+        batchPipeline : bool
+            train on batches shuffled every epoch and prepared by a
+            background thread, see data.batch_pipeline; needs an in-memory
+            training set
 
         Attributes
         ----------
@@ -45,22 +98,51 @@ class MultilayerPerceptron(Classifier):
         learningRate : float
         weightDecayRate : float
         epochs : positive int
+        batchSize : positive int
+        dtype : numpy dtype
+        fusedOutput : bool
+            True if the output derivative is computed as output - target
         performancesTraining: array of floats
         performancesValidation: array of floats
+        monitoredEpochs: array of ints
+            the epochs the performances have been recorded for
         """
 
         self.learningRate = learningRate
         self.weightDecayRate = weightDecayRate
         self.epochs = epochs
+        self.batchSize = batchSize
+        if dtype is None:
+            dtype = train.dtype if train is not None else np.float64
+        self.dtype = np.dtype(dtype)
         self.outputTask = outputTask  # Either classification or regression
         self.inputActivation = inputActivation
         self.outputActivation = outputActivation
         self.earlyStoppingEpochs = earlyStoppingEpochs
+        self.earlyStopping = (earlyStopping if earlyStopping is not None
+                              else EarlyStopping(earlyStoppingEpochs))
+        self.monitorEvery = monitorEvery
+        self.checkpointDir = checkpointDir
+        self.checkpointEvery = checkpointEvery
+        self.resume = resume
+        self.optimizer = getOptimizer(optimizer)
+        self.learningRateSchedule = getLearningRateSchedule(
+                                    learningRateSchedule)
+        self.numWorkers = numWorkers
+        self.parallelMode = parallelMode
+        self.batchPipeline = batchPipeline
+        self._batchPipeline = None
+        if batchPipeline and train is not None and \
+                not hasattr(train, 'input'):
+            raise ValueError('The batch pipeline needs a training set held '
+                             'in memory')
+        self._parallelTrainer = None
 
         self.trainingSet = train
         self.validationSet = valid
         self.testSet = test
-        
+
+        self.lossString = loss
         if loss == 'bce':
             self.loss = BinaryCrossEntropyError()
         elif loss == 'sse':
@@ -77,40 +159,50 @@ class MultilayerPerceptron(Classifier):
             raise ValueError('There is no predefined loss function ' +
                              'named ' + loss)
 
+        # Skip the activation jacobian for the output layer if possible
+        self.fusedOutput = (outputActivation, loss) in FUSED_OUTPUT_LOSSES
+
         # Record the performance of each epoch for later usages
         # e.g. plotting, reporting..
         self.performancesTraining = []
         self.performancesValidation = []
+        self.monitoredEpochs = []
         self.layers = []
 
+        # Fixed random subset of the training set to estimate the training
+        # accuracy on, evaluating the whole set costs as much as training
+        if train is None:
+            self.monitorInput = None
+            self.monitorLabel = None
+        else:
+            self.monitorInput, self.monitorLabel = \
+                train.sample(monitorTrainingSize)
+
         # Build up the network from specific layers
-        if not layers:
+        if train is None:
+            pass
+        elif not layers:
             # Input layer
-            self.layers.append(LogisticLayer(train.input.shape[1], 128,
-                            None, self.inputActivation, False))
+            self.layers.append(LogisticLayer(train.numInputs, 128,
+                            None, self.inputActivation, False, self.dtype))
 
             # Output layer
             self.layers.append(LogisticLayer(128, 10,
-                            None, self.outputActivation, True))
+                            None, self.outputActivation, True, self.dtype))
 
         else:
-            nIn = train.input.shape[1]
+            nIn = train.numInputs
 
             for layer in layers:
                 self.layers.append(LogisticLayer(nIn, layer,
-                            None, self.inputActivation, False))
+                            None, self.inputActivation, False, self.dtype))
                 nIn = layer
 
             self.layers.append(LogisticLayer(nIn, 10,
-                        None, self.outputActivation, True))
+                        None, self.outputActivation, True, self.dtype))
 
         self.inputWeights = inputWeights
 
-        # add bias values ("1"s) at the beginning of all data sets
-        self.trainingSet.input = np.insert(self.trainingSet.input, 0, 1,axis=1)
-        self.validationSet.input = np.insert(self.validationSet.input, 0, 1, axis=1)
-        self.testSet.input = np.insert(self.testSet.input, 0, 1, axis=1)
-
     def _get_layer(self, layer_index):
         return self.layers[layer_index]
 
@@ -127,29 +219,30 @@ class MultilayerPerceptron(Classifier):
         Parameters
         ----------
         inp : ndarray
-            a numpy array containing the input of the layer
+            a numpy array containing the input of the layer, or a matrix
+            containing one input per row
 
         # Here you have to propagate forward through the layers
         # And remember the activation values of each layer
         """
         input = inp
 
+        # Every layer adds its bias itself, the output of a layer is passed
+        # on as it is
         for layer in self.layers:
-            if layer != self._get_input_layer():
-                input = np.insert(input, 0, 1)
-
             input = layer.forward(input)
 
         return input
 
     def _compute_error(self, target):
         """
-        Compute the total error of the network (error terms from the output layer)
+        Compute the error terms (deltas) of all layers, from the output
+        layer backwards
 
-        Returns
+        Change deltas
         -------
-        ndarray :
-            a numpy array (1,nOut) containing the output of the layer
+        deltas: ndarray
+            the deltas of every layer, one row per sample of the batch
         """
 
         tempWeights = None
@@ -157,15 +250,18 @@ class MultilayerPerceptron(Classifier):
 
         for layer in reversed(self.layers):
             if layer == self._get_output_layer():
-                layer.computeDerivative(self.loss.calculateDerivative(target, layer.outp), 1.0)
+                if self.fusedOutput:
+                    layer.computeOutputDerivative(target)
+                else:
+                    # the derivative of every sample on its own (the 'sum'
+                    # reduction), computeGradient averages over the batch
+                    layer.computeDerivative(self.loss.calculateDerivative(
+                                            target, layer.outp, 'sum'), 1.0)
             else:
                 layer.computeDerivative(tempDerivatives, tempWeights[1:])
 
             tempWeights = layer.weights
             tempDerivatives = layer.deltas
-
-        output = self._get_output_layer().outp
-        return self.loss.calculateError(target, output)
     
     def _update_weights(self, learningRate):
         """
@@ -173,7 +269,8 @@ class MultilayerPerceptron(Classifier):
         """
 
         for layer in reversed(self.layers):
-            layer.updateWeights(self.learningRate, self.weightDecayRate)
+            layer.updateWeights(learningRate, self.weightDecayRate,
+                                self.optimizer)
         
     def train(self, verbose=True):
         """Train the Multi-layer Perceptrons
@@ -184,49 +281,193 @@ class MultilayerPerceptron(Classifier):
             Print logging messages with validation accuracy if verbose is True.
         """
 
+        startEpoch = 0
+        stopped = False
+        if self.resume:
+            startEpoch, stopped = self._load_checkpoint()
+
+        if self.numWorkers > 1:
+            self._parallelTrainer = DataParallelTrainer(self, self.numWorkers,
+                                                        self.parallelMode)
+            self._parallelTrainer.start()
+
+        try:
+            stopped = self._train_epochs(startEpoch, verbose) or stopped
+        finally:
+            if self._parallelTrainer is not None:
+                self._parallelTrainer.close()
+                self._parallelTrainer = None
+
+        self.saveCheckpoint(self.epochs, stopped)
+
+        # Continue with the weights of the best validation performance
+        self.earlyStopping.restore(self.layers)
+
+    def _train_epochs(self, startEpoch, verbose):
+        """
+        Train the epochs from startEpoch on
+
+        Returns
+        -------
+        bool :
+            True if the training has been stopped early
+        """
         # Run the training "epochs" times, print out the logs
-        for epoch in range(self.epochs):
+        for epoch in range(startEpoch, self.epochs):
 
             if verbose:
                 print("Training epoch {0}/{1}.."
                       .format(epoch + 1, self.epochs))
 
-            self._train_one_epoch()
+            learningRate = self.learningRateSchedule.getLearningRate(
+                self.learningRate, epoch, self.epochs,
+                self.performancesValidation)
+            self._train_one_epoch(learningRate)
 
-            accuracyTraining = accuracy_score(self.trainingSet.label,
-                                        self.evaluate(self.trainingSet))
-            accuracyValidation = accuracy_score(self.validationSet.label,
-                                        self.evaluate(self.validationSet))
-            # Record the performance of each epoch for later usages
-            # e.g. plotting, reporting..
-            self.performancesTraining.append(accuracyTraining)
-            self.performancesValidation.append(accuracyValidation)
+            if ((epoch + 1) % self.monitorEvery == 0 and
+                    self._monitor(epoch, verbose)):
+                print("Early stopping, no improvement in validation set.")
 
-            if verbose:
-                print("Accuracy on training: {0:.2f}%"
-                      .format(accuracyTraining * 100))
-                print("Accuracy on validation: {0:.2f}%"
-                      .format(accuracyValidation * 100))
-                print("-----------------------------")
+                # resize epochs
+                self.epochs = epoch + 1
+
+                return True
+
+            if (epoch + 1) % self.checkpointEvery == 0:
+                self.saveCheckpoint(epoch + 1)
+
+        # Score the epochs after the last monitored one as well, otherwise
+        # restoring the best weights would always drop them
+        if startEpoch < self.epochs and self.epochs % self.monitorEvery:
+            self._monitor(self.epochs - 1, verbose)
+
+        return False
+
+    def _monitor(self, epoch, verbose):
+        """
+        Record the performances after an epoch
+
+        Returns
+        -------
+        bool :
+            True if the training should be stopped early
+        """
+        accuracyTraining = accuracy_score(self.monitorLabel,
+                                    self.evaluate(self.monitorInput))
+        accuracyValidation = accuracy_score(self.validationSet.label,
+                                    self.evaluate(self.validationSet))
+        # Record the performance of each epoch for later usages
+        # e.g. plotting, reporting..
+        self.performancesTraining.append(accuracyTraining)
+        self.performancesValidation.append(accuracyValidation)
+        self.monitoredEpochs.append(epoch)
 
-            if epoch > self.earlyStoppingEpochs:
-                noImprovement = 0
+        if verbose:
+            print("Accuracy on training: {0:.2f}%"
+                  .format(accuracyTraining * 100))
+            print("Accuracy on validation: {0:.2f}%"
+                  .format(accuracyValidation * 100))
+            print("-----------------------------")
 
-                for i in range(1, self.earlyStoppingEpochs+1):
-                    currentPerf = self.performancesValidation[-i]
-                    prevPerf = self.performancesValidation[-(i+1)]
+        return self.earlyStopping.update(epoch, accuracyValidation,
+                                         self.layers)
 
-                    if (currentPerf - prevPerf) < 0 or np.isclose(currentPerf, prevPerf, atol=0.001):
-                        noImprovement += 1
+    def _get_checkpoint_path(self):
+        return os.path.join(self.checkpointDir, 'checkpoint.npz')
 
-                if noImprovement >= self.earlyStoppingEpochs:
-                    print("Early stopping, no improvement in validation set.")
+    def saveCheckpoint(self, epoch, stopped=False):
+        """
+        Save the state of the training to checkpointDir
 
-                    # resize epochs
-                    self.epochs = epoch + 1
+        The weights of all layers, the performance histories, the state of
+        the optimizer, the early stopping and of numpy's global random
+        generator are
+        written atomically into one .npz file, which always holds the
+        latest checkpoint.
 
-                    break
+        Parameters
+        ----------
+        epoch : int
+            number of epochs trained so far
+        stopped : bool
+            the training has been stopped early, resuming it does not
+            train any further
+        """
+        if self.checkpointDir is None:
+            return
+
+        if not os.path.exists(self.checkpointDir):
+            os.makedirs(self.checkpointDir)
+
+        rngName, rngKeys, rngPos, rngHasGauss, rngGauss = \
+            np.random.get_state()
+        state = {'epoch': epoch,
+                 'stopped': stopped,
+                 'performancesTraining': self.performancesTraining,
+                 'performancesValidation': self.performancesValidation,
+                 'monitoredEpochs': np.asarray(self.monitoredEpochs, int),
+                 'rngKeys': rngKeys,
+                 'rngPos': rngPos,
+                 'rngHasGauss': rngHasGauss,
+                 'rngGauss': rngGauss}
+        for i, layer in enumerate(self.layers):
+            state['weights' + str(i)] = layer.weights
+            for key, value in (layer.optimizerState or {}).items():
+                state['optimizer' + str(i) + '_' + key] = value
+        for key, value in self.earlyStopping.getState().items():
+            state['earlyStopping_' + key] = value
+
+        atomicWrite(self._get_checkpoint_path(),
+                    lambda f: np.savez(f, **state))
+
+    def _load_checkpoint(self):
+        """
+        Restore the state saved by saveCheckpoint, if there is one
 
+        Returns
+        -------
+        int :
+            the epoch to continue the training with
+        bool :
+            True if the training has already been stopped early
+        """
+        if (self.checkpointDir is None or
+                not os.path.exists(self._get_checkpoint_path())):
+            return 0, False
+
+        with np.load(self._get_checkpoint_path()) as state:
+            for i, layer in enumerate(self.layers):
+                np.copyto(layer.weights, state['weights' + str(i)])
+
+                prefix = 'optimizer' + str(i) + '_'
+                if any(key.startswith(prefix) for key in state.files):
+                    layer.optimizerState = \
+                        self.optimizer.createState(layer.weights)
+                    for key, value in layer.optimizerState.items():
+                        np.copyto(value, state[prefix + key])
+
+            self.performancesTraining = \
+                state['performancesTraining'].tolist()
+            self.performancesValidation = \
+                state['performancesValidation'].tolist()
+            self.monitoredEpochs = state['monitoredEpochs'].tolist()
+
+            np.random.set_state(('MT19937', state['rngKeys'],
+                                 int(state['rngPos']),
+                                 int(state['rngHasGauss']),
+                                 float(state['rngGauss'])))
+
+            prefix = 'earlyStopping_'
+            self.earlyStopping.setState(
+                dict((key[len(prefix):], state[key]) for key in state.files
+                     if key.startswith(prefix)))
+
+            epoch = int(state['epoch'])
+            stopped = bool(state['stopped'])
+            if stopped:
+                self.epochs = epoch
+
+        return epoch, stopped
 
     def classify(self, test_instance):
         # Classify an instance given the model of the classifier
@@ -234,38 +475,80 @@ class MultilayerPerceptron(Classifier):
         outp = self._feed_forward(test_instance)
         return np.argmax(outp)
 
+    def predict_proba(self, testInputs):
+        """Compute the network output for a whole matrix of instances.
+
+        Parameters
+        ----------
+        testInputs : ndarray
+            a (n, nIn) matrix containing one instance per row
+
+        Returns
+        -------
+        ndarray :
+            a (n, nOut) matrix containing the output of the network
+        """
+        # The whole matrix is pushed through every layer with one np.dot,
+        # copy the result as the layer reuses its output buffer
+        return np.array(self._feed_forward(
+            np.asarray(testInputs, dtype=self.dtype)))
+
+    def predict(self, testInputs):
+        """Classify a whole matrix of instances.
+
+        Returns
+        -------
+        ndarray :
+            the predicted class of every row of testInputs
+        """
+        return np.argmax(self.predict_proba(testInputs), axis=-1)
+
     def evaluate(self, test=None):
         """Evaluate a whole dataset.
 
         Parameters
         ----------
-        test : the dataset to be classified
+        test : the dataset (or its input matrix) to be classified
         if no test data, the test set associated to the classifier will be used
 
         Returns
         -------
-        List:
-            List of classified decisions for the dataset's entries.
+        ndarray:
+            Classified decisions for the dataset's entries.
         """
         if test is None:
             test = self.testSet.input
-        # Once you can classify an instance, just use map for all of the test
-        # set.
-        return list(map(self.classify, test))        
-
-    def _train_one_epoch(self):
-        for label, data in zip(self.trainingSet.label, self.trainingSet.input):
-            self._feed_forward(data)
-            self._compute_error(self._get_encoded_label(label))
-            self._update_weights(self.learningRate)
-
-    def _get_encoded_label(self, label):
-        zeros = np.zeros(self._get_output_layer().nOut)
-        zeros[label] = 1.0
-        return zeros
-
-    def __del__(self):
-        # Remove the bias from input data
-        self.trainingSet.input = np.delete(self.trainingSet.input, 0, axis=1)
-        self.validationSet.input = np.delete(self.validationSet.input, 0, axis=1)
-        self.testSet.input = np.delete(self.testSet.input, 0, axis=1)
+        # A DataSet can be passed directly, classify its input matrix
+        return self.predict(getattr(test, 'input', test))
+
+    def _train_one_epoch(self, learningRate=None):
+        if learningRate is None:
+            learningRate = self.learningRate
+
+        if self._parallelTrainer is not None:
+            self._parallelTrainer.trainEpoch(learningRate)
+            return
+
+        # Propagate batchSize samples at once, so every layer works on a
+        # (batch, nIn) matrix instead of a single vector. The training set
+        # may be in memory (DataSet) or streamed from disk
+        # (StreamingDataSet)
+        if self.batchPipeline:
+            batches = self._get_batch_pipeline().iterBatches()
+        else:
+            batches = self.trainingSet.iterBatches(
+                self.batchSize, self._get_output_layer().nOut, self.dtype)
+
+        for inputs, targets in batches:
+            self._feed_forward(inputs)
+            self._compute_error(targets)
+            self._update_weights(learningRate)
+
+    def _get_batch_pipeline(self):
+        # The buffers are allocated once and reused by every epoch, the
+        # shuffling draws from np.random so resumed trainings are exact
+        if self._batchPipeline is None:
+            self._batchPipeline = BatchPipeline(
+                self.trainingSet, self.batchSize,
+                self._get_output_layer().nOut, self.dtype)
+        return self._batchPipeline
@@ -6,6 +6,7 @@ import logging
 import numpy as np
 
 from util.activation_functions import Activation
+from util.learning_rate_schedules import getLearningRateSchedule
 from model.classifier import Classifier
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
@@ -24,6 +25,16 @@ class Perceptron(Classifier):
     test : list
     learningRate : float
     epochs : positive int
+    learningRateSchedule : string or LearningRateSchedule
+        learning rate of every epoch, see
+        util.learning_rate_schedules.getLearningRateSchedule
+    batchSize : positive int
+        1 updates after every misclassified instance (online); a mini-batch
+        is scored at once and all its mistakes are applied in one matrix
+        operation; None scores the whole training set at once (full batch)
+    averaged : bool
+        predict with the average of the weights over all update steps
+        (averaged perceptron), which generalizes better than the last ones
 
     Attributes
     ----------
@@ -32,12 +43,19 @@ class Perceptron(Classifier):
     trainingSet : list
     validationSet : list
     testSet : list
-    weight : list
+    weight : ndarray
+        the weights, the first entry is the bias
     """
-    def __init__(self, train, valid, test, learningRate=0.01, epochs=50):
+    def __init__(self, train, valid, test, learningRate=0.01, epochs=50,
+                 learningRateSchedule='constant', batchSize=1,
+                 averaged=False):
 
         self.learningRate = learningRate
         self.epochs = epochs
+        self.learningRateSchedule = getLearningRateSchedule(
+                                    learningRateSchedule)
+        self.batchSize = batchSize
+        self.averaged = averaged
 
         self.trainingSet = train
         self.validationSet = valid
@@ -51,7 +69,11 @@ class Perceptron(Classifier):
         # add bias weights at the beginning with the same random initialize
         self.weight = np.insert(self.weight, 0, np.random.rand()/10)
 
-        
+        # Updates weighted by the step they were made in, the average of the
+        # weights over all steps follows from them in O(1) (Daume, 2006)
+        self._weightUpdates = np.zeros_like(self.weight)
+        self._step = 1
+
     def train(self, verbose=True):
         """Train the perceptron with the perceptron learning algorithm.
 
@@ -65,29 +87,57 @@ class Perceptron(Classifier):
         from util.loss_functions import DifferentError
         loss = DifferentError()
 
+        inputs = self.trainingSet.input
+        labels = np.asarray(self.trainingSet.label)
+        batchSize = self.batchSize or len(labels)
+
         learned = False
         iteration = 0
 
-        # Train for some epochs if the error is not 0
+        # Train for some epochs if there are still mistakes
         while not learned:
-            totalError = 0
-            for input, label in zip(self.trainingSet.input,
-                                    self.trainingSet.label):
-                output = self.fire(input)
-                if output != label:
-                    error = loss.calculateError(label, output)
-                    self.updateWeights(input, error)
-                    totalError += error
+            mistakes = 0
+            # The perceptron has no validation history
+            learningRate = self.learningRateSchedule.getLearningRate(
+                self.learningRate, iteration, self.epochs, [])
+
+            if batchSize == 1:
+                for input, label in zip(inputs, labels):
+                    output = self.fire(input)
+                    if output != label:
+                        error = loss.calculateError(label, output)
+                        self.updateWeights(input, error, learningRate)
+                        mistakes += 1
+                    self._step += 1
+            else:
+                for start in range(0, len(labels), batchSize):
+                    end = start + batchSize
+                    # Score the whole batch and update with all of its
+                    # misclassified rows at once
+                    error = loss.calculateError(
+                        labels[start:end],
+                        self.fire(inputs[start:end]).astype(labels.dtype))
+                    wrong = np.flatnonzero(error)
+                    if len(wrong):
+                        self.updateWeights(inputs[start:end][wrong],
+                                           error[wrong], learningRate)
+                        mistakes += len(wrong)
+                    self._step += 1
 
             iteration += 1
-            
+
             if verbose:
-                logging.info("Epoch: %i; Error: %i", iteration, -totalError)
-            
-            if totalError == 0 or iteration >= self.epochs:
+                logging.info("Epoch: %i; Mistakes: %i", iteration, mistakes)
+
+            if mistakes == 0 or iteration >= self.epochs:
                 # stop criteria is reached
                 learned = True
 
+        if self.averaged:
+            self.weight -= self._weightUpdates / self._step
+            self._weightUpdates.fill(0)
+            self._step = 1
+
     def classify(self, testInstance):
         """Classify a single instance.
 
@@ -102,30 +152,61 @@ class Perceptron(Classifier):
         """
         return self.fire(testInstance)
 
+    def predict(self, testInputs):
+        """Classify a whole matrix of instances.
+
+        Parameters
+        ----------
+        testInputs : ndarray
+            a matrix containing one instance per row
+
+        Returns
+        -------
+        ndarray :
+            True for every row of testInputs recognized as a 7
+        """
+        return self.fire(testInputs)
+
     def evaluate(self, test=None):
         """Evaluate a whole dataset.
 
         Parameters
         ----------
-        test : the dataset to be classified
+        test : the dataset (or its input matrix) to be classified
         if no test data, the test set associated to the classifier will be used
 
         Returns
         -------
-        List:
-            List of classified decisions for the dataset's entries.
+        ndarray:
+            Classified decisions for the dataset's entries.
         """
         if test is None:
             test = self.testSet.input
-        # Once you can classify an instance, just use map for all of the test
-        # set.
-        return list(map(self.classify, test))
+        # A DataSet can be passed directly, classify its input matrix
+        return self.predict(getattr(test, 'input', test))
 
-    def updateWeights(self, input, error):
-        self.weight += self.learningRate*error*input
+    def updateWeights(self, input, error, learningRate=None):
+        """
+        Move the weights by the error of an instance, or by the errors of a
+        matrix of instances (one error per row) at once
+        """
+        if learningRate is None:
+            learningRate = self.learningRate
+        update = np.empty_like(self.weight)
+        update[0] = learningRate * np.sum(error)
+        update[1:] = np.dot(learningRate * error, input)
+        self.weight += update
+        if self.averaged:
+            update *= self._step
+            self._weightUpdates += update
 
     def fire(self, input):
-        """Fire the output of the perceptron corresponding to the input """
-        return Activation.sign(np.dot(np.array(input), self.weight))
-        
-        
+        """Fire the output of the perceptron corresponding to the input
+
+        The input can also be a matrix with one instance per row, then one
+        output per row is fired.
+        """
+        # The bias weight is added on its own, inputs are never copied to
+        # prepend a 1
+        return Activation.sign(np.dot(input, self.weight[1:]) +
+                               self.weight[0])
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Post-training int8 quantization of a trained MultilayerPerceptron.
+
+Every weight matrix is stored as int8 with one scale per output unit
+(per-channel, symmetric), the biases stay floating point. The inputs of
+every layer are quantized to int8 with one scale per layer, calibrated on
+the validation set by running it through the float network. A layer then
+computes
+
+    (int8 input) x (int8 weights) accumulated as integers
+    * input scale * channel scales + bias -> activation
+
+The integer products are accumulated with float32 BLAS as long as the sum
+is exactly representable (nIn * 127 * 127 < 2 ** 24, i.e. nIn <= 1040),
+which gives the same result as an int32 accumulation but is far faster in
+numpy; wider layers fall back to an int32 matmul. The float32 copy of the
+integer weights BLAS needs is made once, on the first forward pass.
+
+The quantized network only does inference, it cannot be trained: retrain
+the float model and quantize it again.
+"""
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+from util.activation_functions import getActivationFunction
+
+# Largest magnitude of the symmetric int8 range, -128 is not used
+QMAX = 127
+
+# Sums of up to this many int8 products are exact in float32
+EXACT_FLOAT32_INPUTS = 2 ** 24 // (QMAX * QMAX)
+
+
+def quantizeSymmetric(values, scale):
+    """Returns round(values / scale) clipped to the int8 range"""
+    return _quantize_float32(values, scale).astype(np.int8)
+
+
+def _quantize_float32(values, scale, out=None):
+    # the int8 values as (exact) float32
+    quantized = np.divide(values, scale, out=out, dtype=np.float32)
+    np.rint(quantized, out=quantized)
+    np.clip(quantized, -QMAX, QMAX, out=quantized)
+    return quantized
+
+
+class QuantizedLayer(object):
+    """
+    Inference-only int8 version of a LogisticLayer
+
+    Parameters
+    ----------
+    layer : LogisticLayer
+        the trained float layer
+    inputScale : float
+        scale of the int8 inputs, i.e. the calibrated input range / 127
+
+    Attributes
+    ----------
+    nIn : positive int
+    nOut : positive int
+    weights : ndarray
+        (nIn, nOut) int8 weights without the bias row
+    weightScales : ndarray
+        (nOut,) float32 scale of every output unit (column)
+    bias : ndarray
+        (nOut,) float32 bias
+    inputScale : float
+    activationString : string
+    """
+
+    def __init__(self, layer, inputScale):
+        self.nIn = layer.nIn
+        self.nOut = layer.nOut
+        self.activationString = layer.activationString
+        self.activation = getActivationFunction(self.activationString)
+        self.inputScale = np.float32(inputScale)
+
+        weights = layer.weights[1:]
+        self.weightScales = (np.max(np.abs(weights), axis=0) /
+                             QMAX).astype(np.float32)
+        # a dead unit with all-zero weights keeps all-zero int8 weights
+        self.weightScales[self.weightScales == 0] = 1
+        self.weights = quantizeSymmetric(weights, self.weightScales)
+        self.bias = np.array(layer.weights[0], dtype=np.float32)
+
+        # scale turning the integer sums back into net inputs
+        self.outputScales = self.inputScale * self.weightScales
+
+        # the integer weights as float32 for the BLAS accumulation, and the
+        # buffers of the quantized input and the output, reused by every
+        # forward pass with the same batch size
+        self._accumulationWeights = None
+        self._quantizedInput = np.empty((0, self.nIn), np.float32)
+        self.outp = np.empty((0, self.nOut), np.float32)
+
+    def forward(self, inp):
+        """
+        Returns the float32 output of the layer for a (batch, nIn) float
+        input matrix, the array is overwritten by the next forward pass
+        """
+        inp = np.atleast_2d(inp)
+        if self.outp.shape[0] != inp.shape[0]:
+            self._quantizedInput = np.empty(inp.shape, np.float32)
+            self.outp = np.empty((inp.shape[0], self.nOut), np.float32)
+        accumulated = self.outp
+
+        if self.nIn <= EXACT_FLOAT32_INPUTS:
+            if self._accumulationWeights is None:
+                self._accumulationWeights = self.weights.astype(np.float32)
+            np.dot(_quantize_float32(inp, self.inputScale,
+                                     out=self._quantizedInput),
+                   self._accumulationWeights, out=accumulated)
+        else:
+            np.copyto(accumulated,
+                      np.matmul(quantizeSymmetric(inp, self.inputScale),
+                                self.weights, dtype=np.int32),
+                      casting='unsafe')
+
+        accumulated *= self.outputScales
+        accumulated += self.bias
+        return self.activation(accumulated, out=accumulated)
+
+    def getSize(self):
+        """Returns the number of bytes of the parameters of the layer"""
+        return (self.weights.nbytes + self.weightScales.nbytes +
+                self.bias.nbytes)
+
+
+class QuantizedMultilayerPerceptron(object):
+    """
+    Inference-only int8 version of a MultilayerPerceptron, created by
+    quantize
+
+    It predicts like a Classifier but has no train method, retrain the
+    float model and quantize it again instead.
+
+    Parameters
+    ----------
+    layers : list of QuantizedLayer
+
+    Attributes
+    ----------
+    layers : list of QuantizedLayer
+    dtype : numpy dtype
+        type of the inputs and outputs, float32
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+        self.dtype = np.dtype(np.float32)
+
+    def predict_proba(self, testInputs):
+        """Compute the network output for a (n, nIn) matrix of instances"""
+        output = np.asarray(testInputs, dtype=np.float32)
+        for layer in self.layers:
+            output = layer.forward(output)
+        # copy, the layer reuses its output buffer
+        return np.array(output)
+
+    def predict(self, testInputs):
+        """Returns the predicted class of every row of testInputs"""
+        return np.argmax(self.predict_proba(testInputs), axis=-1)
+
+    def classify(self, testInstance):
+        return self.predict(np.asarray(testInstance)[np.newaxis])[0]
+
+    def evaluate(self, test):
+        """Classify a data set (or its input matrix)"""
+        return self.predict(getattr(test, 'input', test))
+
+    def getSize(self):
+        """Returns the number of bytes of the parameters of the network"""
+        return sum(layer.getSize() for layer in self.layers)
+
+
+def calibrateInputScales(model, inputs, percentile=99.99, batchSize=1000):
+    """
+    Run inputs through the float network and return the int8 scale of the
+    input of every layer
+
+    The input range of a layer is the given percentile of the absolute
+    values of its inputs, so a few outliers do not waste the int8 range.
+    """
+    samples = [[] for _ in model.layers]
+
+    for start in range(0, len(inputs), batchSize):
+        output = np.asarray(inputs[start:start + batchSize],
+                            dtype=model.dtype)
+        for index, layer in enumerate(model.layers):
+            samples[index].append(np.abs(output).ravel())
+            # copy, the layer reuses its output buffer
+            output = np.array(layer.forward(output))
+
+    scales = []
+    for values in samples:
+        limit = np.percentile(np.concatenate(values), percentile)
+        scales.append(float(limit) / QMAX if limit > 0 else 1.0)
+    return scales
+
+
+def quantize(model, calibrationSet=None, percentile=99.99):
+    """
+    Quantize a trained MultilayerPerceptron to int8
+
+    Parameters
+    ----------
+    model : MultilayerPerceptron
+    calibrationSet : DataSet or ndarray
+        inputs to calibrate the input ranges of the layers on, by default
+        the validation set of the model
+    percentile : float
+        percentile of the absolute layer inputs mapped to 127
+
+    Returns
+    -------
+    QuantizedMultilayerPerceptron
+    """
+    if calibrationSet is None:
+        calibrationSet = model.validationSet
+    inputs = getattr(calibrationSet, 'input', calibrationSet)
+
+    scales = calibrateInputScales(model, inputs, percentile)
+    return QuantizedMultilayerPerceptron(
+        [QuantizedLayer(layer, scale)
+         for layer, scale in zip(model.layers, scales)])
+
+
+def quantizationReport(model, quantized, dataSet):
+    """
+    Compare the float and the quantized model on a data set
+
+    Returns
+    -------
+    dict :
+        accuracies of both models, their difference (quantized - float),
+        the fraction of identical predictions and the parameter sizes
+    """
+    labels = np.asarray(dataSet.label)
+    if labels.ndim > 1:
+        labels = np.argmax(labels, axis=-1)
+
+    floatPrediction = model.predict(dataSet.input)
+    quantizedPrediction = quantized.predict(dataSet.input)
+
+    floatAccuracy = accuracy_score(labels, floatPrediction)
+    quantizedAccuracy = accuracy_score(labels, quantizedPrediction)
+
+    return {'floatAccuracy': floatAccuracy,
+            'quantizedAccuracy': quantizedAccuracy,
+            'accuracyDelta': quantizedAccuracy - floatAccuracy,
+            'agreement': float(np.mean(floatPrediction ==
+                                       quantizedPrediction)),
+            'floatBytes': sum(layer.weights.nbytes
+                              for layer in model.layers),
+            'quantizedBytes': quantized.getSize()}
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Model files of the MultilayerPerceptron and LogisticRegression.
+
+A model file holds only what is needed to predict, never the data sets:
+
+    magic (8 bytes) | header length (uint64, little endian) | JSON header |
+    padding | weights of layer 0 | padding | weights of layer 1 | ...
+
+The JSON header describes the model (format version, model class, dtype,
+the constructor options and for every layer its shape, activation and the
+byte offset of its weights). Every weight matrix is stored as raw C-order
+bytes starting at a multiple of ALIGNMENT, so loading memory-maps them
+directly as the weights of the layers: loading costs no copy, and all
+processes loading the same file share one copy in the page cache.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from model.logistic_layer import LogisticLayer
+from model.logistic_regression import LogisticRegression
+from model.mlp import MultilayerPerceptron
+from util.files import atomicWrite
+
+MAGIC = b'NNMODEL\x00'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _get_layers(model):
+    if isinstance(model, MultilayerPerceptron):
+        return model.layers
+    elif isinstance(model, LogisticRegression):
+        return [model.layer]
+    else:
+        raise ValueError('Cannot save a model of type ' +
+                         type(model).__name__)
+
+
+def saveModel(model, path):
+    """
+    Save the weights and architecture of a model
+
+    Parameters
+    ----------
+    model : MultilayerPerceptron or LogisticRegression
+    path : string
+        the model file, replaced atomically
+    """
+    layers = _get_layers(model)
+    dtype = np.dtype(model.dtype)
+
+    header = {'version': VERSION,
+              'model': type(model).__name__,
+              'dtype': dtype.str,
+              'options': {'loss': model.lossString},
+              'layers': []}
+    if isinstance(model, MultilayerPerceptron):
+        header['options'].update(outputTask=model.outputTask,
+                                 inputActivation=model.inputActivation,
+                                 outputActivation=model.outputActivation)
+
+    # The offsets depend on the header length and the header contains the
+    # offsets, so lay the blobs out relative to the aligned header end and
+    # grow the reserved header space until it fits
+    reserved = ALIGNMENT
+    while True:
+        offset = reserved
+        header['layers'] = []
+        for layer in layers:
+            header['layers'].append({'nIn': layer.nIn,
+                                     'nOut': layer.nOut,
+                                     'activation': layer.activationString,
+                                     'isClassifierLayer':
+                                         layer.isClassifierLayer,
+                                     'offset': offset})
+            offset = _align(offset + layer.weights.size * dtype.itemsize)
+
+        encoded = json.dumps(header).encode('utf-8')
+        if len(MAGIC) + 8 + len(encoded) <= reserved:
+            break
+        reserved = _align(len(MAGIC) + 8 + len(encoded))
+
+    def write(f):
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        for layer, description in zip(layers, header['layers']):
+            f.write(b'\x00' * (description['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(layer.weights, dtype).data)
+
+    atomicWrite(path, write)
+
+
+def readHeader(path):
+    """Returns the JSON header of a model file as a dict"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a model file')
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+
+    if header['version'] > VERSION:
+        raise ValueError('{0} has format version {1}, only versions up to '
+                         '{2} are supported'.format(path, header['version'],
+                                                    VERSION))
+    return header
+
+
+def loadModel(path, mmap=True):
+    """
+    Load a model saved with saveModel
+
+    Parameters
+    ----------
+    path : string
+    mmap : bool
+        memory-map the weights copy-on-write: they are read on demand,
+        shared between processes and can still be trained further (changed
+        pages become private). False reads them into memory.
+
+    Returns
+    -------
+    MultilayerPerceptron or LogisticRegression :
+        a model without data sets, ready to predict
+    """
+    header = readHeader(path)
+    dtype = np.dtype(header['dtype'])
+    options = header['options']
+
+    layers = []
+    for description in header['layers']:
+        shape = (description['nIn'] + 1, description['nOut'])
+        if mmap:
+            weights = np.memmap(path, dtype, 'c', description['offset'],
+                                shape).view(np.ndarray)
+        else:
+            weights = np.fromfile(path, dtype, shape[0] * shape[1],
+                                  offset=description['offset'])
+            weights = weights.reshape(shape)
+
+        layers.append(LogisticLayer(description['nIn'], description['nOut'],
+                                    weights, description['activation'],
+                                    description['isClassifierLayer']))
+
+    if header['model'] == 'MultilayerPerceptron':
+        model = MultilayerPerceptron(None, None, None, dtype=dtype,
+                                     **options)
+        model.layers = layers
+    elif header['model'] == 'LogisticRegression':
+        model = LogisticRegression(None, None, None, dtype=dtype, **options)
+        model.layer = layers[0]
+    else:
+        raise ValueError('Unknown model type ' + str(header['model']) +
+                         ' in ' + path)
+
+    return model
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from random import random
+
+import numpy as np
+
 from model.classifier import Classifier
 
 __author__ = "ABC XYZ"  # Adjust this when you copy the file
@@ -32,5 +35,8 @@ class StupidRecognizer(Classifier):
         # byChance is the probability of being correctly recognized
         return random() < self.byChance
 
+    def predict(self, testInputs):
+        return np.random.random_sample(len(testInputs)) < self.byChance
+
     def evaluate(self):
-        return list(map(self.classify, self.testSet.input))
+        return self.predict(self.testSet.input)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""
+Data-parallel training of a MultilayerPerceptron on several processes.
+
+The weights of the network are moved into shared memory, every worker
+process (forked from the training process, so it shares the data sets
+copy-on-write) works on the same weights. Two modes are supported:
+
+sync
+    Every mini-batch is split into one shard per worker. The workers write
+    the gradient of their shard into their slot of a shared gradient
+    buffer, the training process sums them up (all-reduce) and applies the
+    optimizer. Apart from floating point summation order this is the same
+    as training on one core.
+
+hogwild
+    The mini-batches of an epoch are dealt out to the workers, which update
+    the shared weights with plain SGD without any locking (Niu et al.,
+    2011). The updates race, which works well for sparse-ish gradients and
+    small learning rates.
+
+Every worker should use a single BLAS thread, e.g. by starting the training
+with OPENBLAS_NUM_THREADS=1, otherwise the processes oversubscribe the
+cores.
+"""
+
+import multiprocessing
+import threading
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from util.optimizers import SGD
+
+
+class DataParallelTrainer(object):
+    """
+    Train the epochs of a MultilayerPerceptron on a pool of processes
+
+    Parameters
+    ----------
+    model : MultilayerPerceptron
+    numWorkers : positive int
+        number of worker processes
+    mode : string
+        'sync' (all-reduce of the gradients) or 'hogwild' (lock-free SGD)
+    timeout : float
+        seconds to wait for the workers of one batch before giving up
+    """
+
+    def __init__(self, model, numWorkers=4, mode='sync', timeout=600):
+        if not hasattr(model.trainingSet, 'input'):
+            raise ValueError('Data-parallel training needs a training set '
+                             'held in memory')
+        if mode not in ('sync', 'hogwild'):
+            raise ValueError('Unknown data-parallel mode: ' + str(mode))
+        if (mode == 'hogwild' and
+                not (isinstance(model.optimizer, SGD) and
+                     not model.optimizer.momentum)):
+            raise ValueError('Hogwild training only supports plain SGD')
+
+        self.model = model
+        self.numWorkers = numWorkers
+        self.mode = mode
+        self.timeout = timeout
+
+        self._memory = None
+        self._workers = []
+        self._connections = []
+
+    def start(self):
+        """Move the weights into shared memory and start the workers"""
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise ValueError('Data-parallel training needs the fork start '
+                             'method, which this platform does not support')
+
+        layers = self.model.layers
+        dtype = layers[0].weights.dtype
+
+        # Build the one-hot targets before forking, so the workers share them
+        self.model.trainingSet.getTargets(layers[-1].nOut, dtype)
+        weightSizes = [layer.weights.size for layer in layers]
+
+        # One block holding the weights of all layers followed by the
+        # gradient slots of all workers
+        self._memory = shared_memory.SharedMemory(
+            create=True,
+            size=sum(weightSizes) * (1 + self.numWorkers) * dtype.itemsize)
+
+        offset = 0
+        for layer in layers:
+            shared = np.ndarray(layer.weights.shape, dtype,
+                                buffer=self._memory.buf, offset=offset)
+            np.copyto(shared, layer.weights)
+            layer.weights = shared
+            offset += shared.nbytes
+
+        # gradients[i] is a (numWorkers, nIn + 1, nOut) stack for layer i
+        self._gradients = []
+        for layer in layers:
+            stack = np.ndarray((self.numWorkers,) + layer.weights.shape,
+                               dtype, buffer=self._memory.buf, offset=offset)
+            stack.fill(0)
+            self._gradients.append(stack)
+            offset += stack.nbytes
+
+        # The training process takes part in the barriers of sync mode
+        self._barrier = context.Barrier(self.numWorkers + 1)
+
+        for rank in range(self.numWorkers):
+            parentConnection, childConnection = context.Pipe()
+            worker = context.Process(target=self._work,
+                                     args=(rank, childConnection))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+            self._connections.append(parentConnection)
+
+    def trainEpoch(self, learningRate):
+        """Train one epoch of the model on the workers"""
+        if self.mode == 'sync':
+            self._train_epoch_sync(learningRate)
+        else:
+            self._train_epoch_hogwild(learningRate)
+
+    def close(self):
+        """
+        Stop the workers and move the weights back into private memory
+        """
+        for connection in self._connections:
+            try:
+                connection.send(('stop',))
+            except (OSError, EOFError):
+                pass
+        for worker in self._workers:
+            worker.join(self.timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+        for layer in self.model.layers:
+            layer.weights = np.array(layer.weights)
+
+        self._gradients = []
+        self._workers = []
+        self._connections = []
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+    def _get_batches(self):
+        numSamples = len(self.model.trainingSet.input)
+        batchSize = self.model.batchSize
+        return [(start, min(start + batchSize, numSamples))
+                for start in range(0, numSamples, batchSize)]
+
+    def _train_epoch_sync(self, learningRate):
+        model = self.model
+
+        for connection in self._connections:
+            connection.send(('sync',))
+
+        for _ in self._get_batches():
+            # wait for the gradients of all shards
+            self._wait()
+
+            # all-reduce: the workers have weighted their gradients by the
+            # size of their shard already
+            for layer, stack in zip(model.layers, self._gradients):
+                np.sum(stack, axis=0, out=layer.gradient)
+                if model.weightDecayRate:
+                    layer.gradient += model.weightDecayRate * layer.weights
+                if layer.optimizerState is None:
+                    layer.optimizerState = \
+                        model.optimizer.createState(layer.weights)
+                model.optimizer.update(layer.weights, layer.gradient,
+                                       layer.optimizerState, learningRate)
+
+            # release the workers into the next batch
+            self._wait()
+
+    def _train_epoch_hogwild(self, learningRate):
+        for connection in self._connections:
+            connection.send(('hogwild', learningRate))
+
+        for connection in self._connections:
+            if not connection.poll(self.timeout):
+                raise RuntimeError('Data-parallel worker timed out')
+            self._check_reply(connection.recv())
+
+    def _wait(self):
+        try:
+            self._barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            for connection in self._connections:
+                if connection.poll(1):
+                    self._check_reply(connection.recv())
+            raise RuntimeError('Data-parallel worker failed or timed out')
+
+    def _check_reply(self, reply):
+        if reply[0] == 'error':
+            raise RuntimeError('Data-parallel worker failed:\n' + reply[1])
+
+    def _work(self, rank, connection):
+        """Main loop of a worker process"""
+        model = self.model
+        inputs = model.trainingSet.input
+        dtype = model.layers[0].weights.dtype
+        targets = model.trainingSet.getTargets(model.layers[-1].nOut, dtype)
+
+        # The worker's gradients are written directly into its shared slot
+        for layer, stack in zip(model.layers, self._gradients):
+            layer.gradient = stack[rank]
+
+        try:
+            while True:
+                command = connection.recv()
+
+                if command[0] == 'stop':
+                    break
+                elif command[0] == 'sync':
+                    for start, end in self._get_batches():
+                        # contiguous shard of the batch of this worker
+                        bounds = np.linspace(start, end,
+                                             self.numWorkers + 1).astype(int)
+                        low, high = bounds[rank], bounds[rank + 1]
+
+                        if high > low:
+                            model._feed_forward(
+                                inputs[low:high].astype(dtype, copy=False))
+                            model._compute_error(targets[low:high])
+                            for layer in model.layers:
+                                layer.computeGradient()
+                                layer.gradient *= ((high - low) /
+                                                   float(end - start))
+                        else:
+                            for layer in model.layers:
+                                layer.gradient.fill(0)
+
+                        self._barrier.wait(self.timeout)
+                        self._barrier.wait(self.timeout)
+                elif command[0] == 'hogwild':
+                    learningRate = command[1]
+                    batches = self._get_batches()
+                    for start, end in batches[rank::self.numWorkers]:
+                        model._feed_forward(
+                            inputs[start:end].astype(dtype, copy=False))
+                        model._compute_error(targets[start:end])
+                        for layer in model.layers:
+                            layer.computeGradient(model.weightDecayRate)
+                            # racy update of the shared weights
+                            layer.gradient *= learningRate
+                            layer.weights -= layer.gradient
+                    connection.send(('done',))
+        except Exception:
+            self._barrier.abort()
+            connection.send(('error', traceback.format_exc()))
+        finally:
+            connection.close()
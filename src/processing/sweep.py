@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+"""
+Hyperparameter sweeps with asynchronous successive halving (ASHA).
+
+Every configuration is first trained for a few epochs only. As soon as a
+configuration is among the best 1/reductionFactor of the configurations
+which finished the same rung, it is promoted to the next rung and trained
+further (resuming from its checkpoint), up to maxEpochs. Bad
+configurations are therefore dropped early and the freed workers are given
+to the promising ones.
+
+A sweep can be interrupted and run again: its checkpoints live in a
+directory named after its configurations and rungs, the finished rungs
+are read back from the results file.
+"""
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from data.shared_data import attachDataSet
+from model.mlp import MultilayerPerceptron
+
+
+def gridConfigurations(**axes):
+    """
+    Returns all combinations of the given values as list of dicts, e.g.
+    gridConfigurations(learningRate=[0.01, 0.1], weightDecayRate=[0, 1e-5])
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(axes[name] for name in names))]
+
+
+def trainConfiguration(sharedData, configuration, epochs, checkpointDir,
+                       modelClass=MultilayerPerceptron):
+    """
+    Train one configuration up to `epochs` epochs in a worker process
+
+    The training continues from the checkpoint of the previous rung, if any.
+
+    Returns
+    -------
+    dict :
+        the best validation accuracy so far, the number of trained epochs
+        and whether the training has been stopped early
+    """
+    trainingSet, validationSet, testSet = map(attachDataSet, sharedData)
+
+    parameters = dict(configuration)
+    parameters.update(epochs=epochs, checkpointDir=checkpointDir,
+                      resume=True)
+    model = modelClass(trainingSet, validationSet, testSet, **parameters)
+    model.train(verbose=False)
+
+    return {'validation': max(model.performancesValidation or [0.0]),
+            'epochs': model.epochs,
+            'stopped': model.epochs < epochs}
+
+
+class SuccessiveHalving(object):
+    """
+    Asynchronous successive halving scheduler running on a process pool
+
+    Parameters
+    ----------
+    sharedData : list
+        descriptions of the published training, validation and test set,
+        see data.shared_data.publishDataSet
+    configurations : list of dicts
+        the keyword arguments of the model for every configuration
+    checkpointRoot : string
+        directory the run directories of the sweeps are created in
+    resultsPath : string
+        CSV file the result of every finished rung is appended to; the
+        rows of this sweep are read back when it is run again
+    minEpochs : positive int
+        number of epochs of the first rung
+    maxEpochs : positive int
+        number of epochs of the last rung
+    reductionFactor : int >= 2
+        only the best 1/reductionFactor of a rung are promoted, the number
+        of epochs grows by this factor from rung to rung
+    numWorkers : positive int
+        number of worker processes
+    modelClass : class
+        the classifier to train, it has to support checkpoints
+    runDirectory : string
+        directory every configuration checkpoints into a subdirectory of,
+        by default checkpointRoot/sweep-<id> with an id derived from the
+        configurations and rungs; a sweep run again with the same
+        configurations therefore resumes, a changed grid starts afresh
+
+    Attributes
+    ----------
+    rungEpochs : list of ints
+        number of epochs of every rung
+    sweepId : string
+        name of the sweep in the results file
+    results : list of dicts
+        one entry per finished rung of a configuration; failed trials have
+        the message of their exception as 'error' and no validation
+    """
+
+    def __init__(self, sharedData, configurations, checkpointRoot,
+                 resultsPath, minEpochs=20, maxEpochs=500, reductionFactor=3,
+                 numWorkers=8, modelClass=MultilayerPerceptron,
+                 runDirectory=None):
+        self.sharedData = sharedData
+        self.configurations = configurations
+        self.checkpointRoot = checkpointRoot
+        self.resultsPath = resultsPath
+        self.reductionFactor = reductionFactor
+        self.numWorkers = numWorkers
+        self.modelClass = modelClass
+
+        self.rungEpochs = [minEpochs]
+        while self.rungEpochs[-1] < maxEpochs:
+            self.rungEpochs.append(min(maxEpochs,
+                                       self.rungEpochs[-1] * reductionFactor))
+
+        # configuration ids point to the same hyperparameters as long as
+        # the id of the sweep is the same
+        description = json.dumps([configurations, self.rungEpochs,
+                                  modelClass.__name__],
+                                 sort_keys=True, default=str)
+        self.sweepId = 'sweep-' + hashlib.sha1(
+            description.encode('utf-8')).hexdigest()[:12]
+        self.runDirectory = (runDirectory if runDirectory is not None else
+                             os.path.join(checkpointRoot, self.sweepId))
+
+        # Scores of the configurations which finished a rung, and the
+        # configurations which have already been promoted out of a rung
+        self._rungScores = [{} for _ in self.rungEpochs]
+        self._promoted = [set() for _ in self.rungEpochs]
+        self._pending = list(range(len(configurations)))
+        self.results = []
+
+    def run(self):
+        """
+        Run the sweep until no configuration can be promoted any more,
+        continuing from the results of an earlier (interrupted) run
+
+        Returns
+        -------
+        dict :
+            the result of the best configuration of the highest rung reached
+        """
+        running = {}
+
+        if not os.path.exists(self.runDirectory):
+            os.makedirs(self.runDirectory)
+        self._load_results()
+
+        with ProcessPoolExecutor(max_workers=self.numWorkers) as executor:
+            while True:
+                # Keep every worker busy as long as there is something to do
+                while len(running) < self.numWorkers:
+                    job = self._get_job()
+                    if job is None:
+                        break
+                    running[self._submit(executor, *job)] = job
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    configurationId, rung = running.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        # a failed trial, the other ones go on
+                        traceback.print_exc()
+                        outcome = {'validation': None, 'epochs': None,
+                                   'stopped': None,
+                                   'error': '{0}: {1}'.format(
+                                       type(e).__name__, e)}
+                    self._record(configurationId, rung, outcome)
+
+        return self.getBest()
+
+    def getBest(self):
+        """Returns the best result of the highest rung reached so far"""
+        for rung in reversed(range(len(self.rungEpochs))):
+            results = [result for result in self.results
+                       if result['rung'] == rung and not result['error']]
+            if results:
+                return max(results, key=lambda result: result['validation'])
+        return None
+
+    def getCheckpointDir(self, configurationId):
+        return os.path.join(self.runDirectory,
+                            'configuration' + str(configurationId))
+
+    def _get_job(self):
+        """
+        Returns (configurationId, rung) of the next training job, promotions
+        to higher rungs first, or None if nothing can be started right now
+        """
+        for rung in reversed(range(len(self.rungEpochs) - 1)):
+            scores = self._rungScores[rung]
+            best = sorted(scores, key=scores.get, reverse=True)
+            for configurationId in best[:len(best) // self.reductionFactor]:
+                if configurationId not in self._promoted[rung]:
+                    self._promoted[rung].add(configurationId)
+                    return configurationId, rung + 1
+
+        if self._pending:
+            return self._pending.pop(0), 0
+
+        return None
+
+    def _submit(self, executor, configurationId, rung):
+        return executor.submit(trainConfiguration, self.sharedData,
+                               self.configurations[configurationId],
+                               self.rungEpochs[rung],
+                               self.getCheckpointDir(configurationId),
+                               self.modelClass)
+
+    def _record(self, configurationId, rung, outcome, write=True):
+        """Add the outcome of a rung to the scheduler and the results"""
+        outcome = dict(outcome)
+        outcome.setdefault('error', '')
+        if rung == 0 and configurationId in self._pending:
+            self._pending.remove(configurationId)
+        if rung > 0:
+            self._promoted[rung - 1].add(configurationId)
+        if not outcome['error']:
+            # failed trials are never promoted
+            self._rungScores[rung][configurationId] = outcome['validation']
+
+        result = dict(self.configurations[configurationId])
+        result.update(outcome, configuration=configurationId, rung=rung)
+        self.results.append(result)
+
+        if not write:
+            return
+        if outcome['error']:
+            print("Configuration {0} failed in rung {1}: {2}"
+                  .format(configurationId, rung, outcome['error']))
+        else:
+            print("Configuration {0} finished rung {1} ({2} epochs): "
+                  "{3:.2f}% on validation"
+                  .format(configurationId, rung, outcome['epochs'],
+                          outcome['validation'] * 100))
+        self._write_result(result)
+
+    def _get_field_names(self):
+        names = set()
+        for configuration in self.configurations:
+            names.update(configuration)
+        return (['sweep', 'configuration', 'rung', 'epochs', 'stopped',
+                 'validation', 'error'] + sorted(names))
+
+    def _load_results(self):
+        """Replay the rows of this sweep in the results file"""
+        if self.results or not os.path.exists(self.resultsPath):
+            return
+
+        with open(self.resultsPath) as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames not in (None, self._get_field_names()):
+                raise ValueError(self.resultsPath + ' holds the results of '
+                                 'a sweep with other hyperparameters, use '
+                                 'another results file')
+            for row in reader:
+                if row['sweep'] != self.sweepId:
+                    continue
+                failed = bool(row['error'])
+                self._record(int(row['configuration']), int(row['rung']),
+                             {'validation': (None if failed else
+                                             float(row['validation'])),
+                              'epochs': (None if failed else
+                                         int(row['epochs'])),
+                              'stopped': (None if failed else
+                                          row['stopped'] == 'True'),
+                              'error': row['error']},
+                             write=False)
+
+    def _write_result(self, result):
+        writeHeader = (not os.path.exists(self.resultsPath) or
+                       os.path.getsize(self.resultsPath) == 0)
+
+        with open(self.resultsPath, 'a') as f:
+            writer = csv.DictWriter(f, self._get_field_names())
+            if writeHeader:
+                writer.writeheader()
+            writer.writerow(dict(result, sweep=self.sweepId))
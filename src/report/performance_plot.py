@@ -15,10 +15,15 @@ class PerformancePlot(object):
 
     def draw_performance_epoch(self, performancesTraining, performancesValidation,
                                epochs, learningRate=0, weightDecayRate=0, show=True):
-        plt.plot(range(epochs), performancesTraining, 'k',
-                 range(epochs), performancesTraining, 'bo')
-        plt.plot(range(epochs), performancesValidation, 'k',
-                 range(epochs), performancesValidation, 'ro')
+        # epochs is either the number of epochs or the list of the epochs
+        # the performances have been recorded for
+        if isinstance(epochs, int):
+            epochs = range(epochs)
+
+        plt.plot(epochs, performancesTraining, 'k',
+                 epochs, performancesTraining, 'bo')
+        plt.plot(epochs, performancesValidation, 'k',
+                 epochs, performancesValidation, 'ro')
         plt.title("Performance of " + self.name + " over the epochs")
         plt.ylim(ymax=1)
         plt.ylabel("Accuracy")
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+Inference server for trained models.
+
+The server loads a model file (see model.serialization) once and answers
+HTTP requests over TCP or a Unix socket (asyncio, no third-party
+packages). Concurrent requests are collected into micro-batches: a batch
+is run as soon as it has maxBatchSize rows or the oldest request has
+waited maxWait seconds, so the model does one batched forward pass for
+many requests.
+
+Endpoints
+---------
+POST /predict
+    body {"inputs": [[...], ...]} with one instance per row, answers
+    {"predictions": [...], "probabilities": [...]}
+GET /stats
+    latency percentiles (p50, p99) and throughput counters
+
+Usage: python -m serving.server MODEL [--port 8080 | --unix PATH]
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model.serialization import loadModel
+
+
+class LatencyStats(object):
+    """
+    Counters and latency percentiles of the served requests
+
+    Parameters
+    ----------
+    window : positive int
+        number of most recent requests the percentiles are computed over
+    """
+
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.batchSizes = collections.deque(maxlen=window)
+        self.numRequests = 0
+        self.numRows = 0
+        self.numBatches = 0
+        self.startTime = time.time()
+
+    def recordBatch(self, numRows):
+        self.numBatches += 1
+        self.batchSizes.append(numRows)
+
+    def recordRequest(self, numRows, latency):
+        self.numRequests += 1
+        self.numRows += numRows
+        self.latencies.append(latency)
+
+    def getStats(self):
+        uptime = time.time() - self.startTime
+        latencies = np.asarray(self.latencies) * 1000
+        stats = {'requests': self.numRequests,
+                 'rows': self.numRows,
+                 'batches': self.numBatches,
+                 'uptimeSeconds': uptime,
+                 'requestsPerSecond': self.numRequests / uptime,
+                 'rowsPerSecond': self.numRows / uptime,
+                 'meanBatchRows': (float(np.mean(self.batchSizes))
+                                   if self.batchSizes else 0.0)}
+        if len(latencies):
+            stats.update(p50Ms=float(np.percentile(latencies, 50)),
+                         p99Ms=float(np.percentile(latencies, 99)))
+        return stats
+
+
+class MicroBatcher(object):
+    """
+    Collect concurrent prediction requests into batched forward passes
+
+    Parameters
+    ----------
+    model : Classifier
+        a model with predict_proba, e.g. a MultilayerPerceptron
+    maxBatchSize : positive int
+        maximal number of rows of a batch
+    maxWait : float
+        seconds the first request of a batch waits for further requests
+    """
+
+    def __init__(self, model, maxBatchSize=64, maxWait=0.002):
+        self.model = model
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.stats = LatencyStats()
+
+        self._queue = None
+        # The forward passes run on one thread, so requests arriving in the
+        # meantime are collected into the next batch
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def predict(self, inputs):
+        """
+        Returns the model output for a (n, nIn) matrix, computed together
+        with the concurrent requests
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future))
+        return await future
+
+    async def run(self):
+        """Process the queued requests until cancelled"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+        while True:
+            requests = [await self._queue.get()]
+            numRows = len(requests[0][0])
+            deadline = loop.time() + self.maxWait
+
+            while numRows < self.maxBatchSize:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(),
+                                                     timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                numRows += len(request[0])
+
+            batch = np.concatenate([inputs for inputs, _ in requests])
+            try:
+                outputs = await loop.run_in_executor(
+                    self._executor, self.model.predict_proba, batch)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats.recordBatch(numRows)
+
+            start = 0
+            for inputs, future in requests:
+                if not future.done():
+                    future.set_result(outputs[start:start + len(inputs)])
+                start += len(inputs)
+
+
+class InferenceServer(object):
+    """
+    HTTP/1.1 server answering prediction requests of a model
+
+    Parameters
+    ----------
+    model : Classifier
+        a model with predict_proba
+    maxBatchSize : positive int
+    maxWait : float
+        see MicroBatcher
+    """
+
+    def __init__(self, model, maxBatchSize=64, maxWait=0.002):
+        self.batcher = MicroBatcher(model, maxBatchSize, maxWait)
+        self.dtype = getattr(model, 'dtype', np.float64)
+
+        # Reject malformed rows before they reach (and fail) a shared batch
+        layers = getattr(model, 'layers', None) or [model.layer]
+        self.numInputs = layers[0].nIn
+
+        self._server = None
+        self._batcherTask = None
+
+    async def start(self, host='127.0.0.1', port=8080, unixPath=None):
+        """Start serving, returns the asyncio server"""
+        self._batcherTask = asyncio.ensure_future(self.batcher.run())
+
+        if unixPath is not None:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                           unixPath)
+        else:
+            self._server = await asyncio.start_server(self._handle, host,
+                                                      port)
+        return self._server
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcherTask.cancel()
+
+    async def _handle(self, reader, writer):
+        """Answer the requests of one (keep-alive) connection"""
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, path = requestLine.decode('latin-1').split()[:2]
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError('negative Content-Length')
+                except ValueError:
+                    # where the next request starts is unknown, answer and
+                    # close the connection
+                    await self._write_response(
+                        writer, '400 Bad Request',
+                        {'error': 'malformed request line or '
+                                  'Content-Length'})
+                    break
+
+                body = await reader.readexactly(length)
+                status, response = await self._respond(method, path, body)
+                await self._write_response(writer, status, response)
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write_response(writer, status, response):
+        payload = json.dumps(response).encode('utf-8')
+        writer.write(('HTTP/1.1 {0}\r\n'
+                      'Content-Type: application/json\r\n'
+                      'Content-Length: {1}\r\n\r\n'
+                      .format(status, len(payload)))
+                     .encode('latin-1') + payload)
+        await writer.drain()
+
+    async def _respond(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            return '200 OK', self.batcher.stats.getStats()
+
+        if method == 'POST' and path == '/predict':
+            start = time.time()
+            try:
+                inputs = np.asarray(json.loads(body.decode('utf-8'))
+                                    .get('inputs'), dtype=self.dtype)
+                if inputs.ndim != 2 or inputs.shape[1] != self.numInputs:
+                    raise ValueError('inputs has to be a list of rows of '
+                                     '{0} values'.format(self.numInputs))
+            except (ValueError, AttributeError, TypeError) as e:
+                return '400 Bad Request', {'error': str(e)}
+
+            try:
+                outputs = await self.batcher.predict(inputs)
+            except Exception as e:
+                return '500 Internal Server Error', {'error': str(e)}
+            self.batcher.stats.recordRequest(len(inputs),
+                                             time.time() - start)
+
+            if outputs.ndim == 1:
+                # binary classifier, probability of the positive class
+                predictions = (outputs > 0.5).astype(int)
+            else:
+                predictions = np.argmax(outputs, axis=1)
+            return '200 OK', {'predictions': predictions.tolist(),
+                              'probabilities': outputs.tolist()}
+
+        return '404 Not Found', {'error': 'unknown endpoint ' + path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a trained model')
+    parser.add_argument('model', help='model file written by '
+                        'model.serialization.saveModel')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = InferenceServer(loadModel(args.model), args.max_batch,
+                             args.max_wait_ms / 1000.0)
+
+    async def serve():
+        await server.start(args.host, args.port, args.unix)
+        print("Serving " + args.model + " on " +
+              (args.unix or "{0}:{1}".format(args.host, args.port)))
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
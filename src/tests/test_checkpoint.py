@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+"""
+A training resumed from a checkpoint ends where the uninterrupted one does.
+"""
+
+import tempfile
+import unittest
+
+import numpy as np
+
+from model.mlp import MultilayerPerceptron
+from tests.test_dtype import makeDataSets
+
+
+class CheckpointResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.train, self.valid = makeDataSets()
+        # the layers draw their initial weights from the clock
+        rns = np.random.RandomState(2)
+        self.weights = [rns.uniform(-0.5, 0.5, size=layer.weights.shape)
+                        for layer in MultilayerPerceptron(
+                            self.train, self.valid, self.valid).layers]
+
+    def _make_model(self, epochs, **options):
+        np.random.seed(1)
+        model = MultilayerPerceptron(self.train, self.valid, self.valid,
+                                     epochs=epochs, batchSize=16,
+                                     learningRate=0.01, optimizer='adam',
+                                     batchPipeline=True,
+                                     earlyStoppingEpochs=100, **options)
+        for layer, initial in zip(model.layers, self.weights):
+            layer.weights[...] = initial
+        return model
+
+    def testResumeIsExact(self):
+        uninterrupted = self._make_model(6)
+        uninterrupted.train(verbose=False)
+
+        with tempfile.TemporaryDirectory() as checkpointDir:
+            interrupted = self._make_model(3, checkpointDir=checkpointDir)
+            interrupted.train(verbose=False)
+
+            resumed = self._make_model(6, checkpointDir=checkpointDir,
+                                       resume=True)
+            resumed.train(verbose=False)
+
+        self.assertEqual(resumed.monitoredEpochs, list(range(6)))
+        self.assertEqual(resumed.performancesValidation,
+                         uninterrupted.performancesValidation)
+        for layer, expected in zip(resumed.layers, uninterrupted.layers):
+            np.testing.assert_array_equal(layer.weights, expected.weights)
+            self.assertEqual(sorted(layer.optimizerState),
+                             sorted(expected.optimizerState))
+            for key, value in layer.optimizerState.items():
+                np.testing.assert_array_equal(value,
+                                              expected.optimizerState[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synchronous data-parallel training is the training of a single process.
+"""
+
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from model.mlp import MultilayerPerceptron
+from tests.test_dtype import makeDataSets
+
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(),
+                     'data-parallel training needs the fork start method')
+class SyncDataParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.train, self.valid = makeDataSets()
+        # the layers draw their initial weights from the clock
+        rns = np.random.RandomState(2)
+        self.weights = [rns.uniform(-0.5, 0.5, size=layer.weights.shape)
+                        for layer in MultilayerPerceptron(
+                            self.train, self.valid, self.valid).layers]
+
+    def _train(self, numWorkers):
+        np.random.seed(1)
+        model = MultilayerPerceptron(self.train, self.valid, self.valid,
+                                     epochs=3, batchSize=32,
+                                     learningRate=0.05, optimizer='momentum',
+                                     weightDecayRate=1e-4,
+                                     numWorkers=numWorkers,
+                                     parallelMode='sync')
+        for layer, initial in zip(model.layers, self.weights):
+            layer.weights[...] = initial
+        model.train(verbose=False)
+        return model
+
+    def testSameWeightsAsSingleProcess(self):
+        single = self._train(1)
+        parallel = self._train(2)
+
+        for layer, expected in zip(parallel.layers, single.layers):
+            # only the summation order of the shard gradients differs
+            np.testing.assert_allclose(layer.weights, expected.weights,
+                                       rtol=0, atol=1e-12)
+        # the training did change the weights
+        self.assertGreater(np.max(np.abs(parallel.layers[-1].weights -
+                                         self.weights[-1])), 1e-3)
+        self.assertEqual(parallel.performancesValidation,
+                         single.performancesValidation)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+Training in float32 has to reach the accuracy of the float64 training.
+"""
+
+import unittest
+
+import numpy as np
+
+from data.data_set import DataSet
+from model.mlp import MultilayerPerceptron
+from model.logistic_regression import LogisticRegression
+
+
+def makeDataSets(numSamples=600, numInputs=20, seed=0):
+    """Two linearly separable classes of float64 inputs"""
+    rns = np.random.RandomState(seed)
+    input = rns.uniform(size=(numSamples, numInputs))
+    label = (input[:, 0] > 0.5).astype(np.int16)
+    split = numSamples * 2 // 3
+    return (DataSet.fromArrays(input[:split], label[:split]),
+            DataSet.fromArrays(input[split:], label[split:]))
+
+
+class Float32ParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.train, self.valid = makeDataSets()
+
+    def _train_mlp(self, dtype, weights, **options):
+        np.random.seed(1)
+        model = MultilayerPerceptron(self.train, self.valid, self.valid,
+                                     dtype=dtype, epochs=20, batchSize=16,
+                                     learningRate=0.1, **options)
+        # same initial weights for both types
+        for layer, initial in zip(model.layers, weights):
+            layer.weights[...] = initial
+        model.train(verbose=False)
+        return model
+
+    def _check_mlp(self, **options):
+        # the layers draw their initial weights from the clock
+        rns = np.random.RandomState(2)
+        weights = [rns.uniform(-0.5, 0.5, size=layer.weights.shape)
+                   for layer in MultilayerPerceptron(
+                       self.train, self.valid, self.valid, **options).layers]
+        single = self._train_mlp(np.float32, weights, **options)
+        double = self._train_mlp(np.float64, weights, **options)
+
+        self.assertEqual(single.layers[0].weights.dtype, np.float32)
+        self.assertEqual(single.predict_proba(self.valid.input).dtype,
+                         np.float32)
+        accuracySingle = np.mean(single.evaluate(self.valid) ==
+                                 self.valid.label)
+        accuracyDouble = np.mean(double.evaluate(self.valid) ==
+                                 self.valid.label)
+        self.assertGreater(accuracyDouble, 0.8)
+        self.assertAlmostEqual(accuracySingle, accuracyDouble, delta=0.01)
+
+    def testMlpBceSoftmax(self):
+        # the default setup, the loss derivative is not fused
+        self._check_mlp(loss='bce')
+
+    def testMlpCrossEntropySoftmax(self):
+        self._check_mlp(loss='crossentropy')
+
+    def testMlpSseSigmoid(self):
+        self._check_mlp(loss='sse', outputActivation='sigmoid')
+
+    def testLogisticRegression(self):
+        accuracies = []
+        for loss in ('bce', 'sse'):
+            for dtype in (np.float32, np.float64):
+                model = LogisticRegression(self.train, self.valid,
+                                           self.valid, learningRate=0.5,
+                                           epochs=20, loss=loss, dtype=dtype,
+                                           batchSize=16)
+                model.layer.weights.fill(0)
+                model.train(verbose=False)
+                self.assertEqual(model.layer.weights.dtype, dtype)
+                accuracies.append(np.mean(model.evaluate(self.valid) ==
+                                          self.valid.label))
+        self.assertGreater(min(accuracies), 0.9)
+        self.assertAlmostEqual(accuracies[0], accuracies[1], delta=0.01)
+        self.assertAlmostEqual(accuracies[2], accuracies[3], delta=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
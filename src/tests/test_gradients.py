@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+The weight gradients of a batch are those of the mean loss over the batch.
+"""
+
+import unittest
+
+import numpy as np
+
+from model.mlp import MultilayerPerceptron
+from tests.test_dtype import makeDataSets
+from util.loss_functions import MeanSquaredError
+
+
+class BatchGradientTest(unittest.TestCase):
+
+    def _check(self, loss, outputActivation, batchSize=64):
+        train, valid = makeDataSets()
+        model = MultilayerPerceptron(train, valid, valid, loss=loss,
+                                     outputActivation=outputActivation)
+        rns = np.random.RandomState(0)
+        for layer in model.layers:
+            layer.weights[...] = rns.uniform(-0.5, 0.5, layer.weights.shape)
+
+        input = train.input[:batchSize]
+        target = train.getTargets(10)[:batchSize]
+
+        def meanLoss():
+            return model.loss.calculateError(
+                target, model._feed_forward(input), 'mean')
+
+        meanLoss()
+        model._compute_error(target)
+        for layer in model.layers:
+            gradient = layer.computeGradient().copy()
+            for index in [(0, 0), (1, 3), (5, 7)]:
+                original = layer.weights[index]
+                layer.weights[index] = original + 1e-6
+                upper = meanLoss()
+                layer.weights[index] = original - 1e-6
+                lower = meanLoss()
+                layer.weights[index] = original
+                self.assertAlmostEqual(gradient[index],
+                                       (upper - lower) / 2e-6, places=6)
+
+    def testMse(self):
+        self._check('mse', 'sigmoid')
+
+    def testSse(self):
+        self._check('sse', 'sigmoid')
+
+    def testBce(self):
+        self._check('bce', 'softmax')
+
+    def testCrossEntropy(self):
+        self._check('crossentropy', 'softmax')
+
+
+class ScalarLossTest(unittest.TestCase):
+
+    def testMseOfScalars(self):
+        loss = MeanSquaredError()
+        self.assertAlmostEqual(loss.calculateError(1, 0.9), 0.01)
+        self.assertAlmostEqual(loss.calculateDerivative(1, 0.9), -0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
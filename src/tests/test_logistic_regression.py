@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+The vectorized mini-batch training of LogisticRegression against the
+per-sample update it replaces.
+"""
+
+import unittest
+
+import numpy as np
+
+from model.logistic_regression import LogisticRegression
+from util.activation_functions import Activation
+from tests.test_dtype import makeDataSets
+
+
+def perSampleGradient(weights, input, label, loss):
+    """
+    The gradient of a single instance, computed like the per-sample
+    training did (output, error derivative and sigmoid derivative) with the
+    rounding of the layer, so online training has to match it exactly
+    """
+    netOutput = np.dot(input[np.newaxis], weights[1:, np.newaxis])[0]
+    output = Activation.sigmoid(netOutput + weights[0])[0]
+    if loss == 'bce':
+        # sigmoid with bce: output - label
+        delta = output - label
+    else:
+        # sse: (output - label) * sigmoid'
+        delta = (output - label) * ((1 - output) * output)
+    gradient = np.empty_like(weights)
+    gradient[0] = delta
+    gradient[1:] = input * delta
+    return gradient
+
+
+class VectorizedTrainingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.train, self.valid = makeDataSets(numSamples=300)
+        self.initial = np.random.RandomState(0).uniform(
+            -0.5, 0.5, (self.train.numInputs + 1, 1))
+
+    def _model(self, batchSize, loss='bce'):
+        model = LogisticRegression(self.train, self.valid, self.valid,
+                                   learningRate=0.1, epochs=1, loss=loss,
+                                   batchSize=batchSize)
+        model.layer.weights[...] = self.initial
+        return model
+
+    def testOnlineMatchesPerSampleUpdates(self):
+        for loss in ('bce', 'sse'):
+            model = self._model(1, loss)
+            model.train(verbose=False)
+
+            weights = self.initial[:, 0].copy()
+            for input, label in zip(self.train.input, self.train.label):
+                weights -= 0.1 * perSampleGradient(weights, input, label,
+                                                   loss)
+
+            np.testing.assert_array_equal(model.layer.weights[:, 0], weights)
+
+    def testBatchGradientIsMeanOfSampleGradients(self):
+        batchSize = 16
+        for loss in ('bce', 'sse'):
+            model = self._model(batchSize, loss)
+            inputs = self.train.input[:batchSize]
+            labels = np.asarray(self.train.label[:batchSize])
+
+            model.layer.forward(inputs)
+            if model.fusedOutput:
+                model.layer.computeOutputDerivative(labels[:, np.newaxis])
+            else:
+                model.layer.computeDerivative(model.loss.calculateDerivative(
+                    labels[:, np.newaxis], model.layer.outp, 'sum'), 1.0)
+            gradient = model.layer.computeGradient()[:, 0]
+
+            expected = np.mean([perSampleGradient(self.initial[:, 0], input,
+                                                  label, loss)
+                                for input, label in zip(inputs, labels)],
+                               axis=0)
+            np.testing.assert_allclose(gradient, expected, rtol=1e-12,
+                                       atol=1e-14)
+
+    def testBatchEpochAppliesMeanGradients(self):
+        batchSize = 32
+        model = self._model(batchSize)
+        model.train(verbose=False)
+
+        weights = self.initial[:, 0].copy()
+        for start in range(0, len(self.train), batchSize):
+            end = start + batchSize
+            weights -= 0.1 * np.mean(
+                [perSampleGradient(weights, input, label, 'bce')
+                 for input, label in zip(self.train.input[start:end],
+                                         self.train.label[start:end])],
+                axis=0)
+
+        np.testing.assert_allclose(model.layer.weights[:, 0], weights,
+                                   rtol=1e-12, atol=1e-14)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+The performances are monitored every monitorEvery epochs and after the last.
+"""
+
+import unittest
+
+import numpy as np
+
+from model.mlp import MultilayerPerceptron
+from tests.test_dtype import makeDataSets
+
+
+class MonitorEveryTest(unittest.TestCase):
+
+    def _train(self, epochs, monitorEvery):
+        train, valid = makeDataSets()
+        np.random.seed(1)
+        model = MultilayerPerceptron(train, valid, valid, epochs=epochs,
+                                     batchSize=16, learningRate=0.1,
+                                     monitorEvery=monitorEvery,
+                                     earlyStoppingEpochs=100)
+        model.train(verbose=False)
+        return model
+
+    def testLastEpochIsMonitored(self):
+        model = self._train(5, 2)
+
+        self.assertEqual(model.monitoredEpochs, [1, 3, 4])
+        self.assertEqual(len(model.performancesValidation), 3)
+
+    def testNoExtraMonitoring(self):
+        model = self._train(4, 2)
+
+        self.assertEqual(model.monitoredEpochs, [1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
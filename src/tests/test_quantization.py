@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+The int8 model stores int8 weights and predicts (almost) like the float one.
+"""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from model import quantization
+from model.mlp import MultilayerPerceptron
+from model.quantization import quantizationReport, quantize
+from tests.test_dtype import makeDataSets
+
+
+class QuantizationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.train, cls.valid = makeDataSets()
+        np.random.seed(1)
+        cls.model = MultilayerPerceptron(cls.train, cls.valid, cls.valid,
+                                         layers=[32], inputActivation='relu',
+                                         loss='crossentropy', epochs=10,
+                                         batchSize=16, learningRate=0.1)
+        # the layers draw their initial weights from the clock
+        rns = np.random.RandomState(2)
+        for layer in cls.model.layers:
+            layer.weights[...] = rns.uniform(-0.5, 0.5, layer.weights.shape)
+        cls.model.train(verbose=False)
+        cls.quantized = quantize(cls.model)
+
+    def testInt8Weights(self):
+        for layer, original in zip(self.quantized.layers, self.model.layers):
+            self.assertEqual(layer.weights.dtype, np.int8)
+            self.assertEqual(layer.weights.shape, (layer.nIn, layer.nOut))
+            self.assertLessEqual(np.max(np.abs(layer.weights)), 127)
+            # rounding error of at most half a step per weight
+            dequantized = layer.weights * layer.weightScales
+            self.assertTrue(np.all(np.abs(dequantized - original.weights[1:])
+                                   <= layer.weightScales / 2 + 1e-7))
+
+    def testAccuracyDelta(self):
+        report = quantizationReport(self.model, self.quantized, self.valid)
+
+        self.assertGreater(report['floatAccuracy'], 0.8)
+        self.assertLessEqual(abs(report['accuracyDelta']), 0.02)
+        self.assertGreaterEqual(report['agreement'], 0.97)
+        self.assertLess(report['quantizedBytes'], report['floatBytes'] / 4)
+
+        np.testing.assert_allclose(
+            self.quantized.predict_proba(self.valid.input),
+            self.model.predict_proba(self.valid.input), atol=0.05)
+
+    def testIntegerAccumulation(self):
+        # wide layers sum the int8 products in int32 instead of float32,
+        # both are exact
+        expected = self.quantized.predict_proba(self.valid.input)
+        with mock.patch.object(quantization, 'EXACT_FLOAT32_INPUTS', 0):
+            np.testing.assert_allclose(
+                quantize(self.model).predict_proba(self.valid.input),
+                expected, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
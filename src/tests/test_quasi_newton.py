@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+L-BFGS converges with a monotonically decreasing loss, also when the
+curvature pairs have to be dropped for a steepest descent step.
+"""
+
+import unittest
+
+import numpy as np
+
+from data.data_set import DataSet
+from model.logistic_regression import LogisticRegression
+from util.quasi_newton import LBFGS
+
+
+def quadratic(x):
+    """0.5 x'Ax - b'x with a diagonal A, minimal at x = b / diag(A)"""
+    curvature = np.arange(1.0, len(x) + 1)
+    return (0.5 * np.dot(x, curvature * x) - np.sum(x),
+            curvature * x - 1)
+
+
+class BadCurvatureLBFGS(LBFGS):
+    """Overshoots every quasi-Newton step, so the line search fails"""
+
+    restarts = 0
+
+    def _apply_inverse_hessian(self, gradient, steps, gradientChanges):
+        if not steps:
+            return gradient.copy()
+        self.restarts += 1
+        return 1e6 * gradient
+
+
+class LBFGSTest(unittest.TestCase):
+
+    def _assert_monotonic(self, history):
+        losses = [entry['loss'] for entry in history]
+        self.assertTrue(all(later <= earlier for earlier, later
+                            in zip(losses, losses[1:])), losses)
+
+    def testQuadratic(self):
+        solver = LBFGS()
+        x = solver.minimize(quadratic, np.zeros(5))
+
+        self.assertTrue(solver.converged, solver.message)
+        np.testing.assert_allclose(x, 1 / np.arange(1.0, 6), atol=1e-5)
+        self._assert_monotonic(solver.history)
+
+    def testSteepestDescentRestart(self):
+        solver = BadCurvatureLBFGS(maxLineSearch=5)
+        x = solver.minimize(quadratic, np.zeros(5), maxIterations=500)
+
+        self.assertGreater(solver.restarts, 0)
+        self.assertTrue(solver.converged, solver.message)
+        np.testing.assert_allclose(x, 1 / np.arange(1.0, 6), atol=1e-3)
+        self._assert_monotonic(solver.history)
+
+    def testSeparableLogisticRegression(self):
+        rns = np.random.RandomState(0)
+        input = rns.uniform(size=(200, 5))
+        # a margin around the decision boundary
+        input[:, 0] += np.where(input[:, 0] > 0.5, 0.1, -0.1)
+        label = (input[:, 0] > 0.5).astype(np.int16)
+        dataSet = DataSet.fromArrays(input, label)
+
+        model = LogisticRegression(dataSet, dataSet, dataSet, epochs=200,
+                                   solver='lbfgs', weightDecayRate=1e-3)
+        model.train(verbose=False)
+
+        self.assertLess(len(model.convergence), 200)
+        self.assertLess(model.convergence[-1]['gradientNorm'], 1e-5)
+        self._assert_monotonic(model.convergence)
+        self.assertEqual(np.mean(model.evaluate(dataSet) == label), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+A saved and loaded model predicts exactly what the original model did.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from model.logistic_regression import LogisticRegression
+from model.mlp import MultilayerPerceptron
+from model.serialization import loadModel, readHeader, saveModel
+from tests.test_dtype import makeDataSets
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.train, self.valid = makeDataSets()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'model.bin')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _check(self, model, mmap=True):
+        saveModel(model, self.path)
+        loaded = loadModel(self.path, mmap=mmap)
+
+        self.assertIs(type(loaded), type(model))
+        self.assertEqual(loaded.dtype, model.dtype)
+        np.testing.assert_array_equal(loaded.predict_proba(self.valid.input),
+                                      model.predict_proba(self.valid.input))
+        return loaded
+
+    def testMlp(self):
+        model = MultilayerPerceptron(self.train, self.valid, self.valid,
+                                     layers=[16, 8], inputActivation='lrelu',
+                                     loss='crossentropy', epochs=2,
+                                     batchSize=16)
+        model.train(verbose=False)
+        loaded = self._check(model)
+
+        self.assertEqual(loaded.outputActivation, 'softmax')
+        for layer, original in zip(loaded.layers, model.layers):
+            # the weights are mapped from the file, not read into memory
+            self.assertIsInstance(layer.weights.base, np.memmap)
+            self.assertEqual(layer.activationString,
+                             original.activationString)
+            np.testing.assert_array_equal(layer.weights, original.weights)
+
+    def testMlpFloat32InMemory(self):
+        model = MultilayerPerceptron(self.train, self.valid, self.valid,
+                                     dtype=np.float32)
+        loaded = self._check(model, mmap=False)
+
+        self.assertEqual(loaded.layers[0].weights.dtype, np.float32)
+        self.assertNotIsInstance(loaded.layers[0].weights.base, np.memmap)
+
+    def testLogisticRegression(self):
+        model = LogisticRegression(self.train, self.valid, self.valid,
+                                   epochs=2)
+        model.train(verbose=False)
+        self._check(model)
+
+        self.assertEqual(readHeader(self.path)['model'],
+                         'LogisticRegression')
+
+    def testNotAModelFile(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 64)
+        with self.assertRaises(ValueError):
+            loadModel(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+The inference server batches concurrent requests and rejects malformed ones.
+"""
+
+import asyncio
+import json
+import unittest
+
+import numpy as np
+
+from data.data_set import DataSet
+from model.logistic_regression import LogisticRegression
+from serving.server import InferenceServer
+
+
+def makeModel(numInputs=5):
+    rns = np.random.RandomState(0)
+    input = rns.rand(100, numInputs)
+    dataSet = DataSet.fromArrays(input, (input[:, 0] > 0.5).astype(np.int16))
+    model = LogisticRegression(dataSet, dataSet, dataSet, epochs=1)
+    model.layer.weights[...] = rns.uniform(-0.5, 0.5,
+                                           model.layer.weights.shape)
+    return model
+
+
+async def request(port, raw):
+    """Send a raw HTTP request, returns the status code and the body"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+def post(path, body):
+    return ('POST {0} HTTP/1.1\r\nConnection: close\r\n'
+            'Content-Length: {1}\r\n\r\n'.format(path, len(body))
+            .encode('latin-1') + body)
+
+
+def get(path):
+    return ('GET {0} HTTP/1.1\r\nConnection: close\r\n\r\n'
+            .format(path).encode('latin-1'))
+
+
+class InferenceServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = makeModel()
+
+    def _serve(self, client, **parameters):
+        """Run client(port) against a server on a free port"""
+        async def main():
+            server = InferenceServer(self.model, **parameters)
+            await server.start('127.0.0.1', 0)
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                return await client(port, server)
+            finally:
+                await server.close()
+        return asyncio.run(main())
+
+    def testConcurrentRequestsAreBatched(self):
+        rns = np.random.RandomState(1)
+        inputs = [rns.rand(2, 5) for _ in range(16)]
+        expected = [np.array(self.model.predict_proba(rows))
+                    for rows in inputs]
+
+        async def client(port, server):
+            responses = await asyncio.gather(*(
+                request(port, post('/predict', json.dumps(
+                    {'inputs': rows.tolist()}).encode('utf-8')))
+                for rows in inputs))
+            return responses, server.batcher.stats.getStats()
+
+        responses, stats = self._serve(client, maxBatchSize=64, maxWait=0.05)
+
+        for (status, body), probabilities in zip(responses, expected):
+            self.assertEqual(status, 200)
+            np.testing.assert_allclose(body['probabilities'], probabilities)
+            self.assertEqual(body['predictions'],
+                             (probabilities > 0.5).astype(int).tolist())
+        self.assertEqual(stats['requests'], 16)
+        self.assertEqual(stats['rows'], 32)
+        self.assertGreater(stats['meanBatchRows'], 2)
+
+    def testStats(self):
+        async def client(port, server):
+            for _ in range(3):
+                await request(port, post('/predict',
+                                         b'{"inputs": [[1, 2, 3, 4, 5]]}'))
+            return await request(port, get('/stats'))
+
+        status, stats = self._serve(client)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreater(stats['p50Ms'], 0)
+        self.assertGreaterEqual(stats['p99Ms'], stats['p50Ms'])
+
+    def testMalformedRequests(self):
+        malformed = [post('/predict', b'{"inputs": [[1, 2, 3'),
+                     post('/predict', b'{"inputs": [[1, 2, 3]]}'),
+                     post('/predict', b'[1, 2, 3, 4, 5]'),
+                     b'POST /predict HTTP/1.1\r\nContent-Length: abc\r\n\r\n',
+                     b'POST /predict HTTP/1.1\r\nContent-Length: -5\r\n\r\n',
+                     b'GARBAGE\r\n\r\n']
+
+        async def client(port, server):
+            return [await request(port, raw) for raw in malformed]
+
+        for status, body in self._serve(client):
+            self.assertEqual(status, 400)
+            self.assertIn('error', body)
+
+    def testUnknownPath(self):
+        async def client(port, server):
+            return [await request(port, get('/unknown')),
+                    await request(port, post('/stats', b''))]
+
+        for status, body in self._serve(client):
+            self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,27 @@
 
 """
 Activation functions which can be used within neurons.
+
+Activation holds the activation functions and their derivatives as plain
+functions. The ActivationFunction objects (see getActivationFunction) are
+used by the layers: their forward pass only remembers its output, the
+backward pass derives the derivative from it without transcendental calls,
+so inference pays nothing for training.
 """
 
 import numpy as np
 
+from abc import ABCMeta, abstractmethod
+
 class Activation:
     """
     Containing various activation functions and their derivatives
+
+    All functions work elementwise on vectors as well as on batches (one
+    sample per row). The activation functions accept an optional `out`
+    array which receives the result; it may be netOutput itself to compute
+    the activation in place. For the derivatives `out` has to be a separate
+    buffer.
     """
 
     @staticmethod
@@ -16,82 +30,109 @@ class Activation:
         return netOutput >= threshold
 
     @staticmethod
-    def sigmoid(netOutput):
+    def sigmoid(netOutput, out=None):
         # use e^x from numpy to avoid overflow
-        return 1/(1+np.exp(-1.0*netOutput))
+        # 1/(1+e^-x), computed step by step in the output buffer
+        out = np.negative(netOutput, out=out)
+        np.exp(out, out=out)
+        out += 1.0
+        return np.reciprocal(out, out=out)
 
     @staticmethod
-    def sigmoidPrime(netOutput):
+    def sigmoidPrime(netOutput, out=None):
         # Here you have to code the derivative of sigmoid function
         # netOutput.*(1-netOutput)
-        return netOutput * (1.0 - netOutput)
+        out = np.subtract(1.0, netOutput, out=out)
+        out *= netOutput
+        return out
 
     @staticmethod
-    def tanh(netOutput):
-        # return 2*Activation.sigmoid(2*netOutput)-1
-        ex = np.exp(1.0*netOutput)
-        exn = np.exp(-1.0*netOutput)
-        return np.divide(ex-exn, ex+exn)  # element-wise division
+    def tanh(netOutput, out=None):
+        return np.tanh(netOutput, out=out)
 
     @staticmethod
-    def tanhPrime(netOutput):
+    def tanhPrime(netOutput, out=None):
         # Here you have to code the derivative of tanh function
-        return (1-Activation.tanh(netOutput)**2)
+        # like sigmoidPrime it takes the output of tanh: 1-netOutput^2
+        out = np.square(netOutput, out=out)
+        np.subtract(1.0, out, out=out)
+        return out
 
     @staticmethod
-    def rectified(netOutput):
+    def rectified(netOutput, out=None):
         # leaky relu as normal relu seems to be too aggressive
         # and easily kills the neurons
-        return np.asarray([max(0.00, i) for i in netOutput])
+        return np.maximum(netOutput, 0.0, out=out)
 
     @staticmethod
-    def rectifiedPrime(netOutput):
+    def rectifiedPrime(netOutput, out=None):
         # reluPrime=1 if netOutput > 0 otherwise 0
-        return netOutput > 0
+        return np.greater(netOutput, 0, out=out)
 
     @staticmethod
-    def leakyRectified(netOutput):
+    def leakyRectified(netOutput, out=None, scratch=None):
         # leaky relu as normal relu seems to be too aggressive
         # and easily kills the neurons
-        return np.asarray([max(0.01*i, i) for i in netOutput])
+        # in place the leak term needs a buffer of its own, pass scratch
+        # (shaped like netOutput) to avoid allocating it
+        if out is netOutput:
+            leak = np.multiply(netOutput, 0.01, out=scratch)
+            return np.maximum(netOutput, leak, out=out)
+        out = np.multiply(netOutput, 0.01, out=out)
+        return np.maximum(out, netOutput, out=out)
 
     @staticmethod
-    def leakyRectifiedPrime(netOutput):
+    def leakyRectifiedPrime(netOutput, out=None):
         # leaky relu as normal relu seems to be too aggressive
         # and easily kills the neurons
-        return np.asarray([1.0 if out > 0 else 0.01 for out in netOutput])
+        # 1.0 if netOutput > 0 otherwise 0.01
+        if out is None:
+            out = np.empty_like(netOutput)
+        np.greater(netOutput, 0, out=out)
+        out *= 0.99
+        out += 0.01
+        return out
 
     @staticmethod
-    def identity(netOutput):
-        return netOutput
+    def identity(netOutput, out=None):
+        if out is None or out is netOutput:
+            return netOutput
+        np.copyto(out, netOutput)
+        return out
 
     @staticmethod
-    def identityPrime(netOutput):
+    def identityPrime(netOutput, out=None):
         # identityPrime = 1
-        return ones(netOutput.size)
+        if out is None:
+            return np.ones_like(netOutput)
+        out.fill(1.0)
+        return out
 
     @staticmethod
-    def softmax(netOutput):
+    def softmax(netOutput, out=None):
         # Here you have to code the softmax function
         # exps = [np.exp(out) for out in netOutput]
         # update for numerical stability (avoid overflows)
-        exps = [np.exp(out - np.max(netOutput)) for out in netOutput]
-        return exps / np.sum(exps)
-        
+        # normalize along the last axis, so batches (one row per sample)
+        # work as well
+        out = np.subtract(netOutput,
+                          np.max(netOutput, axis=-1, keepdims=True), out=out)
+        np.exp(out, out=out)
+        out /= np.sum(out, axis=-1, keepdims=True)
+        return out
+
     @staticmethod
     def softmaxPrime(netOutput):
         #https://medium.com/@aerinykim/how-to-implement-the-softmax-derivative-independently-from-any-loss-function-ae6d44363a9d
-        jacobian_m = np.diag(netOutput)
-
-        for i in range(len(jacobian_m)):
-            for j in range(len(jacobian_m)):
-                if i == j:
-                    jacobian_m[i][j] = netOutput[i] * (1-netOutput[i])
-                else: 
-                    jacobian_m[i][j] = -netOutput[i]*netOutput[j]
+        # jacobian[i][j] = out[i] * (delta_ij - out[j]), one matrix per
+        # sample if netOutput is a batch
+        jacobian_m = -(netOutput[..., :, np.newaxis] *
+                       netOutput[..., np.newaxis, :])
+        diagonal = np.einsum('...ii->...i', jacobian_m)
+        diagonal += netOutput
 
         return jacobian_m
-        
+
     @staticmethod
     def getActivation(str):
         """
@@ -135,3 +176,151 @@ class Activation:
         else:
             raise ValueError('Cannot get the derivative of'
                              ' the activation function: ' + str)
+
+
+class ActivationFunction:
+    """
+    Abstract class of an activation function of a layer
+
+    forward computes the activation and remembers its output (a reference,
+    no copy); backward turns the derivative w.r.t. the output into the
+    derivative w.r.t. the net input of the last forward pass, so the output
+    must not be modified in between.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self.output = None
+        self.derivative = None
+
+    def __call__(self, netOutput, out=None):
+        return self.forward(netOutput, out)
+
+    @abstractmethod
+    def forward(self, netOutput, out=None):
+        # activation of netOutput, out may be netOutput itself
+        pass
+
+    @abstractmethod
+    def backward(self, gradient, out=None):
+        # gradient * derivative of the last forward pass, out may be
+        # gradient itself
+        pass
+
+    def _derivative_buffer(self, output):
+        # reused by every backward pass of the same shape
+        if (self.derivative is None or
+                self.derivative.shape != output.shape or
+                self.derivative.dtype != output.dtype):
+            self.derivative = np.empty_like(output)
+        return self.derivative
+
+
+class ElementwiseActivation(ActivationFunction):
+    """
+    Activation applied to every element on its own, the derivative is
+    computed from the output in the backward pass
+
+    Parameters
+    ----------
+    function : callable
+        an activation of Activation, e.g. Activation.sigmoid
+    derivative : callable
+        its derivative w.r.t. the net input, expressed by the output
+    """
+
+    def __init__(self, function, derivative):
+        ActivationFunction.__init__(self)
+        self.function = function
+        self.derivativeFunction = derivative
+
+    def forward(self, netOutput, out=None):
+        self.output = self._activate(netOutput, out)
+        return self.output
+
+    def backward(self, gradient, out=None):
+        # e.g. y(1-y) for sigmoid, 1-y^2 for tanh, the 0/1 (0.01/1) mask
+        # for relu (leaky relu): no transcendental call
+        derivative = self.derivativeFunction(
+            self.output, out=self._derivative_buffer(self.output))
+        return np.multiply(gradient, derivative, out=out)
+
+    def _activate(self, netOutput, out):
+        return self.function(netOutput, out=out)
+
+
+class LeakyRectifiedActivation(ElementwiseActivation):
+    """
+    Leaky relu, keeps a buffer for the leak term so the activation is
+    computed in place without a temporary
+    """
+
+    def __init__(self):
+        ElementwiseActivation.__init__(self, Activation.leakyRectified,
+                                       Activation.leakyRectifiedPrime)
+        self.scratch = None
+
+    def _activate(self, netOutput, out):
+        if out is not netOutput:
+            return self.function(netOutput, out=out)
+        if (self.scratch is None or
+                self.scratch.shape != netOutput.shape or
+                self.scratch.dtype != netOutput.dtype):
+            self.scratch = np.empty_like(netOutput)
+        return self.function(netOutput, out=out, scratch=self.scratch)
+
+
+class IdentityActivation(ActivationFunction):
+    """
+    Linear activation, the derivative is 1
+    """
+
+    def forward(self, netOutput, out=None):
+        return Activation.identity(netOutput, out=out)
+
+    def backward(self, gradient, out=None):
+        return Activation.identity(gradient, out=out)
+
+
+class SoftmaxActivation(ActivationFunction):
+    """
+    Softmax over the last axis
+
+    The jacobian is never built: the backward pass of a gradient g is
+    y * (g - sum(g * y)) with the output y of the forward pass.
+    """
+
+    def forward(self, netOutput, out=None):
+        self.output = Activation.softmax(netOutput, out=out)
+        return self.output
+
+    def backward(self, gradient, out=None):
+        output = self.output
+        dot = np.sum(gradient * output, axis=-1, keepdims=True)
+        out = np.subtract(gradient, dot, out=out)
+        out *= output
+        return out
+
+
+def getActivationFunction(str):
+    """
+    Returns a new activation function object corresponding to the given
+    string, every layer needs its own one
+    """
+
+    if str == 'sigmoid':
+        return ElementwiseActivation(Activation.sigmoid,
+                                     Activation.sigmoidPrime)
+    elif str == 'softmax':
+        return SoftmaxActivation()
+    elif str == 'tanh':
+        return ElementwiseActivation(Activation.tanh, Activation.tanhPrime)
+    elif str == 'relu':
+        return ElementwiseActivation(Activation.rectified,
+                                     Activation.rectifiedPrime)
+    elif str == 'linear':
+        return IdentityActivation()
+    elif str == 'lrelu':
+        return LeakyRectifiedActivation()
+    else:
+        raise ValueError('Unknown activation function: ' + str)
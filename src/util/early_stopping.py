@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Early stopping on the validation performance.
+"""
+
+import numpy as np
+
+
+class EarlyStopping(object):
+    """
+    Keep track of the best validation performance and decide when to stop
+
+    Every update is O(1): only the best performance so far and the number of
+    updates since then are kept, the performance history is not rescanned.
+
+    Parameters
+    ----------
+    patience : positive int
+        number of updates without improvement before training is stopped
+    minDelta : float
+        minimal increase of the performance that counts as an improvement
+    restoreBest : bool
+        snapshot the weights whenever the performance improves, so they can
+        be restored at the end of the training
+
+    Attributes
+    ----------
+    bestPerformance : float
+        best performance seen so far (None before the first update)
+    bestEpoch : int
+        epoch of the best performance
+    wait : int
+        number of updates since the last improvement
+    """
+
+    def __init__(self, patience=5, minDelta=0.001, restoreBest=True):
+        self.patience = patience
+        self.minDelta = minDelta
+        self.restoreBest = restoreBest
+
+        self.bestPerformance = None
+        self.bestEpoch = None
+        self.wait = 0
+
+        # One preallocated copy of the weights of every layer
+        self._bestWeights = None
+
+    def update(self, epoch, performance, layers):
+        """
+        Record the performance of an epoch
+
+        Parameters
+        ----------
+        epoch : int
+        performance : float
+            e.g. the accuracy on the validation set, higher is better
+        layers : list of LogisticLayer
+            the layers whose weights are snapshotted on improvement
+
+        Returns
+        -------
+        bool :
+            True if the training should be stopped
+        """
+        if (self.bestPerformance is None or
+                performance > self.bestPerformance + self.minDelta):
+            self.bestPerformance = performance
+            self.bestEpoch = epoch
+            self.wait = 0
+
+            if self.restoreBest:
+                self._snapshot(layers)
+        else:
+            self.wait += 1
+
+        return self.wait >= self.patience
+
+    def restore(self, layers):
+        """Copy the weights of the best epoch back into the layers"""
+        if self.restoreBest and self._bestWeights is not None:
+            for layer, weights in zip(layers, self._bestWeights):
+                np.copyto(layer.weights, weights)
+
+    def getState(self):
+        """Returns the state as a dict of arrays, e.g. for checkpoints"""
+        state = {'bestPerformance': np.nan if self.bestPerformance is None
+                                    else self.bestPerformance,
+                 'bestEpoch': -1 if self.bestEpoch is None
+                              else self.bestEpoch,
+                 'wait': self.wait}
+        for i, weights in enumerate(self._bestWeights or []):
+            state['bestWeights' + str(i)] = weights
+        return state
+
+    def setState(self, state):
+        """Restore a state returned by getState"""
+        self.bestPerformance = (None if np.isnan(state['bestPerformance'])
+                                else float(state['bestPerformance']))
+        self.bestEpoch = (None if state['bestEpoch'] < 0
+                          else int(state['bestEpoch']))
+        self.wait = int(state['wait'])
+
+        numWeights = len([key for key in state
+                          if key.startswith('bestWeights')])
+        self._bestWeights = [np.array(state['bestWeights' + str(i)])
+                             for i in range(numWeights)] or None
+
+    def _snapshot(self, layers):
+        if self._bestWeights is None:
+            self._bestWeights = [np.empty_like(layer.weights)
+                                 for layer in layers]
+
+        for layer, weights in zip(layers, self._bestWeights):
+            np.copyto(weights, layer.weights)
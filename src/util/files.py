@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers for writing files safely.
+"""
+
+import os
+import tempfile
+
+
+def atomicWrite(path, write, mode='wb'):
+    """
+    Write a file atomically
+
+    The content is written to a temporary file in the same directory which
+    then replaces `path`, so readers (e.g. parallel workers) either see the
+    old or the complete new file, never a partially written one. The file
+    gets the permissions of a file created with open (0666 minus the
+    umask), not the owner-only ones of the temporary file.
+
+    Parameters
+    ----------
+    path : string
+        the file to be written
+    write : callable
+        called with the opened temporary file object to write the content
+    mode : string
+        the mode the temporary file is opened with
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpPath = tempfile.mkstemp(dir=directory,
+                                   prefix='.' + os.path.basename(path),
+                                   suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmpPath, 0o666 & ~_get_umask())
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def _get_umask():
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Learning rate schedules, i.e. the learning rate to train an epoch with.
+
+Every schedule is a pure function of the epoch and the validation history,
+so a resumed training continues with the same learning rates.
+"""
+
+import numpy as np
+
+from abc import ABCMeta, abstractmethod
+
+
+class LearningRateSchedule:
+    """
+    Abstract class of a learning rate schedule
+    """
+    __metaclass__ = ABCMeta
+
+    # the schedule depends on the validation performances, so they have to
+    # be recorded every epoch
+    needsPerformances = False
+
+    @abstractmethod
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        # learning rate of the (0-based) epoch out of epochs, given the
+        # learning rate the model has been configured with and the recorded
+        # validation performances (higher is better)
+        pass
+
+
+class ConstantRate(LearningRateSchedule):
+    """
+    Train every epoch with the base learning rate
+    """
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        return baseRate
+
+
+class StepDecay(LearningRateSchedule):
+    """
+    Multiply the learning rate by factor every stepSize epochs
+    """
+    def __init__(self, stepSize=10, factor=0.5):
+        self.stepSize = stepSize
+        self.factor = factor
+
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        return baseRate * self.factor ** (epoch // self.stepSize)
+
+
+class ExponentialDecay(LearningRateSchedule):
+    """
+    Multiply the learning rate by factor every epoch
+    """
+    def __init__(self, factor=0.95):
+        self.factor = factor
+
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        return baseRate * self.factor ** epoch
+
+
+class CosineAnnealing(LearningRateSchedule):
+    """
+    Cosine annealing with warm restarts (SGDR, Loshchilov and Hutter, 2016)
+
+    The learning rate follows half a cosine from baseRate down to
+    baseRate * minFactor within a period and then restarts; every period is
+    periodFactor times as long as the previous one.
+    """
+    def __init__(self, period=10, periodFactor=2, minFactor=0.0):
+        self.period = period
+        self.periodFactor = periodFactor
+        self.minFactor = minFactor
+
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        # find the period the epoch belongs to
+        period = self.period
+        while epoch >= period:
+            epoch -= period
+            period *= self.periodFactor
+
+        minRate = baseRate * self.minFactor
+        return minRate + 0.5 * (baseRate - minRate) * \
+            (1 + float(np.cos(np.pi * epoch / period)))
+
+
+class OneCycle(LearningRateSchedule):
+    """
+    One cycle policy (Smith, 2018)
+
+    The learning rate rises from baseRate * startFactor up to baseRate
+    during the first warmupFraction of the epochs and then anneals (cosine)
+    down to baseRate * endFactor in the last epoch.
+    """
+    def __init__(self, warmupFraction=0.3, startFactor=0.04,
+                 endFactor=0.0001):
+        self.warmupFraction = warmupFraction
+        self.startFactor = startFactor
+        self.endFactor = endFactor
+
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        warmupEpochs = max(1, int(round(self.warmupFraction * epochs)))
+
+        if epoch < warmupEpochs:
+            start, end = baseRate * self.startFactor, baseRate
+            progress = float(epoch) / warmupEpochs
+        else:
+            start, end = baseRate, baseRate * self.endFactor
+            progress = (float(epoch - warmupEpochs) /
+                        max(1, epochs - 1 - warmupEpochs))
+
+        return end + 0.5 * (start - end) * \
+            (1 + float(np.cos(np.pi * progress)))
+
+
+class ReduceOnPlateau(LearningRateSchedule):
+    """
+    Multiply the learning rate by factor whenever the validation performance
+    has not improved by more than minDelta for patience recorded epochs
+    """
+    needsPerformances = True
+
+    def __init__(self, factor=0.5, patience=5, minDelta=0.001,
+                 minFactor=0.0):
+        self.factor = factor
+        self.patience = patience
+        self.minDelta = minDelta
+        self.minFactor = minFactor
+
+    def getLearningRate(self, baseRate, epoch, epochs, performances):
+        # replay the history, it is short compared to an epoch of training
+        rate = baseRate
+        best = None
+        wait = 0
+
+        for performance in performances:
+            if best is None or performance > best + self.minDelta:
+                best = performance
+                wait = 0
+            else:
+                wait += 1
+                if wait >= self.patience:
+                    rate = max(rate * self.factor, baseRate * self.minFactor)
+                    wait = 0
+
+        return rate
+
+
+def getLearningRateSchedule(schedule):
+    """
+    Returns the schedule corresponding to the given string, schedule
+    instances are returned as they are
+    """
+    if isinstance(schedule, LearningRateSchedule):
+        return schedule
+
+    if schedule == 'constant':
+        return ConstantRate()
+    elif schedule == 'step':
+        return StepDecay()
+    elif schedule == 'exponential':
+        return ExponentialDecay()
+    elif schedule == 'cosine':
+        return CosineAnnealing()
+    elif schedule == 'onecycle':
+        return OneCycle()
+    elif schedule == 'plateau':
+        return ReduceOnPlateau()
+    else:
+        raise ValueError('Unknown learning rate schedule: ' + str(schedule))
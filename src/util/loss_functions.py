@@ -3,62 +3,147 @@
 
 """
 Loss functions.
+
+Every loss works on a single sample (a vector of nOut outputs) as well as on
+a batch ((batch, nOut) matrix, one sample per row). The loss of a sample is
+the sum (the mean for MeanSquaredError) of its element losses, the losses of
+the samples are combined according to the reduction:
+
+'sum'
+    sum over the samples
+'mean'
+    mean over the samples
+'none'
+    one loss per sample (element-wise for DifferentError and AbsoluteError)
+
+The derivatives are those of the reduced loss. calculateErrorAndDerivative
+computes both in one pass, the cross entropies additionally accept the net
+input (logits) of their output activation, which is stable for any logits.
 """
 
 import numpy as np
 
+
+# Pairs of output activation and loss whose combined derivative w.r.t. the
+# net input of the output layer is output - target
+FUSED_OUTPUT_LOSSES = (('softmax', 'crossentropy'), ('sigmoid', 'bce'))
+
+REDUCTIONS = ('mean', 'sum', 'none')
+
 from abc import ABCMeta, abstractmethod, abstractproperty
 
 
+def _clip_probabilities(output):
+    # keep log(output) and log(1 - output) finite, the margin is the
+    # resolution of the output type
+    epsilon = np.finfo(np.result_type(output, np.float32)).eps
+    return np.clip(output, epsilon, 1 - epsilon)
+
+
 class Error:
     """
     Abstract class of an Error
     """
     __metaclass__ = ABCMeta
 
+    # reduction used if none is given
+    reduction = 'sum'
+    # every element counts as a sample of its own
+    elementWise = False
+
     @abstractproperty
     def errorString(self):
         pass
 
     @abstractmethod
-    def calculateError(self, target, output):
-        # calculate the error between target and output
+    def _element_errors_and_derivative(self, target, output):
+        # element-wise losses and their derivatives w.r.t. the output
         pass
-        
-    @abstractmethod
-    def calculateDerivative(self, target, output):
+
+    def calculateError(self, target, output, reduction=None):
         # calculate the error between target and output
-        pass
+        errors, _ = self._element_errors_and_derivative(target, output)
+        return self._reduce(errors, reduction)
+
+    def calculateDerivative(self, target, output, reduction=None):
+        # calculate the derivative of the error w.r.t. the output
+        errors, derivative = self._element_errors_and_derivative(target,
+                                                                  output)
+        return self._scale(derivative, errors, reduction)
+
+    def calculateErrorAndDerivative(self, target, output, reduction=None):
+        """
+        Returns the reduced error and its derivative w.r.t. the output,
+        computed in one pass
+        """
+        errors, derivative = self._element_errors_and_derivative(target,
+                                                                  output)
+        return (self._reduce(errors, reduction),
+                self._scale(derivative, errors, reduction))
+
+    def _get_reduction(self, reduction):
+        reduction = self.reduction if reduction is None else reduction
+        if reduction not in REDUCTIONS:
+            raise ValueError('Unknown reduction: ' + str(reduction))
+        return reduction
+
+    def _sample_errors(self, errors):
+        # the loss of every sample from its element losses
+        if self.elementWise:
+            return errors
+        return np.sum(errors, axis=-1)
+
+    def _reduce(self, errors, reduction):
+        reduction = self._get_reduction(reduction)
+        sampleErrors = self._sample_errors(errors)
+        if reduction == 'none':
+            return sampleErrors
+        elif reduction == 'sum':
+            return np.sum(sampleErrors)
+        return np.mean(sampleErrors)
+
+    def _scale(self, derivative, errors, reduction):
+        # the element derivatives belong to the 'sum' reduction, 'mean'
+        # divides by the number of samples
+        if self._get_reduction(reduction) == 'mean':
+            if self.elementWise:
+                derivative = derivative / np.size(errors)
+            elif np.ndim(errors) > 1:
+                derivative = derivative / (np.size(errors) //
+                                           np.shape(errors)[-1])
+        return derivative
 
 
 class AbsoluteError(Error):
     """
     The Loss calculated by the number of differences between target and output
     """
+    reduction = 'none'
+    elementWise = True
+
     def errorString(self):
         self.errorString = 'absolute'
 
-    def calculateError(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
         # It is the numbers of differences between target and output
-        return abs(target - output)
-        
-    def calculateDerivative(self, target, output):
-        pass
+        difference = np.subtract(output, target)
+        return np.abs(difference), np.sign(difference)
 
 
 class DifferentError(Error):
     """
     The Loss calculated by the number of differences between target and output
     """
+    reduction = 'none'
+    elementWise = True
+
     def errorString(self):
         self.errorString = 'different'
 
-    def calculateError(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
         # It is the numbers of differences between target and output
-        return target - output
-    
-    def calculateDerivative(self, target, output):
-        return -1
+        errors = np.subtract(target, output)
+        return errors, -np.ones_like(errors)
 
 
 class MeanSquaredError(Error):
@@ -66,18 +151,27 @@ class MeanSquaredError(Error):
     The Loss calculated by the mean of the total squares of differences between
     target and output.
     """
+    reduction = 'mean'
+
     def errorString(self):
         self.errorString = 'mse'
 
-    def calculateError(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
         # MSE = 1/n*sum (i=1 to n) of (target_i - output_i)^2)
-        n = np.asarray(target).size
-        return (1.0/n) * np.sum((target - output)**2)
-    
-    def calculateDerivative(self, target, output):
-        # MSEPrime = -n/2*(target - output)
-        n = np.asarray(target).size
-        return (2.0/n) * (output - target)
+        # MSEPrime = 2/n*(output - target), n outputs per sample
+        # a 0-d array instead of a numpy scalar for scalar arguments, so the
+        # square can be taken in place
+        difference = np.asarray(np.subtract(output, target))
+        n = np.shape(difference)[-1] if np.ndim(difference) else 1
+        derivative = difference * (2.0 / n)
+        np.square(difference, out=difference)
+        return difference, derivative
+
+    def _sample_errors(self, errors):
+        if np.ndim(errors) == 0:
+            # a single output
+            return errors
+        return np.mean(errors, axis=-1)
 
 
 class SumSquaredError(Error):
@@ -88,13 +182,11 @@ class SumSquaredError(Error):
     def errorString(self):
         self.errorString = 'sse'
 
-    def calculateError(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
         # SSE = 1/2*sum (i=1 to n) of (target_i - output_i)^2)
-        return 0.5*np.sum((target - output)**2)
-        
-    def calculateDerivative(self, target, output):
         # SSEPrime = -(target - output)
-        return output - target
+        derivative = np.subtract(output, target)
+        return 0.5 * np.square(derivative), derivative
 
 
 class BinaryCrossEntropyError(Error):
@@ -105,13 +197,40 @@ class BinaryCrossEntropyError(Error):
     def errorString(self):
         self.errorString = 'bce'
 
-    def calculateError(self, target, output):
-        return np.sum(target*np.log(output) + (1-target)*np.log(1-output))
-        
-    def calculateDerivative(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
+        # BCE = -(target*log(output) + (1-target)*log(1-output)), with the
+        # output clipped away from 0 and 1
         # BCEPrime = -target/output + (1-target)/(1-output)
-        return -target/output + (1-target)/(1-output)
- 
+        output = _clip_probabilities(output)
+        complement = 1 - output
+        errors = -(target * np.log(output) +
+                   (1 - target) * np.log(complement))
+        derivative = (output - target) / (output * complement)
+        return errors, derivative
+
+    def logitErrorAndDerivative(self, target, netOutput, reduction=None):
+        """
+        The error of a sigmoid output and its derivative w.r.t. the net
+        input (logits) z of the sigmoid, computed together
+
+        log(1 + e^z) - target * z never takes the log of 0, so the loss
+        stays finite for saturated outputs. The derivative is
+        sigmoid(z) - target.
+        """
+        errors = np.logaddexp(0, netOutput)
+        errors -= target * netOutput
+
+        derivative = np.negative(netOutput)
+        # e^-z overflows to inf for very negative z, giving sigmoid 0
+        with np.errstate(over='ignore'):
+            np.exp(derivative, out=derivative)
+        derivative += 1
+        np.reciprocal(derivative, out=derivative)
+        derivative -= target
+
+        return (self._reduce(errors, reduction),
+                self._scale(derivative, errors, reduction))
+
 
 class CrossEntropyError(Error):
     """
@@ -121,10 +240,34 @@ class CrossEntropyError(Error):
     def errorString(self):
         self.errorString = 'crossentropy'
 
-    def calculateError(self, target, output):
+    def _element_errors_and_derivative(self, target, output):
         # https://datascience.stackexchange.com/questions/20296/cross-entropy-loss-explanation
-        return -np.dot(target, np.log(output).clip(min=0.0000000001))
-        
-    def calculateDerivative(self, target, output):
         # https://deepnotes.io/softmax-crossentropy
-        return -(target / output.clip(min=0.0000000001))
+        # clip before the log, log(0) would be -inf
+        output = _clip_probabilities(output)
+        return -(target * np.log(output)), -(target / output)
+
+    def logitErrorAndDerivative(self, target, netOutput, reduction=None):
+        """
+        The error of a softmax output and its derivative w.r.t. the net
+        input (logits) z of the softmax, computed together
+
+        log(softmax(z)) = z - logsumexp(z) is computed with the maximum
+        subtracted, so it is finite for any logits. The derivative is
+        softmax(z) * sum(target) - target, i.e. softmax(z) - target for
+        one-hot targets.
+        """
+        shifted = netOutput - np.max(netOutput, axis=-1, keepdims=True)
+        exps = np.exp(shifted)
+        sums = np.sum(exps, axis=-1, keepdims=True)
+
+        # -target * log(softmax(z))
+        errors = np.log(sums) - shifted
+        errors *= target
+
+        exps /= sums
+        exps *= np.sum(target, axis=-1, keepdims=True)
+        exps -= target
+
+        return (self._reduce(errors, reduction),
+                self._scale(exps, errors, reduction))
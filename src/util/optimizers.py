@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Optimizers, i.e. the rules to update the weights given their gradient.
+"""
+
+import numpy as np
+
+from abc import ABCMeta, abstractmethod
+
+
+class Optimizer:
+    """
+    Abstract class of an optimizer
+
+    The state of an optimizer (e.g. the velocity of momentum) belongs to the
+    weights it updates. It is created once per weight matrix by createState
+    as preallocated buffers, which update modifies in place.
+    """
+    __metaclass__ = ABCMeta
+
+    def createState(self, weights):
+        # buffers kept between the updates of the given weights
+        return {}
+
+    @abstractmethod
+    def update(self, weights, gradient, state, learningRate):
+        # update the weights in place, the gradient may be overwritten
+        pass
+
+
+class SGD(Optimizer):
+    """
+    Stochastic gradient descent, optionally with (Nesterov) momentum
+
+    Parameters
+    ----------
+    momentum : float
+        fraction of the previous update added to the current one
+    nesterov : bool
+        use Nesterov's accelerated gradient
+    """
+    def __init__(self, momentum=0.0, nesterov=False):
+        self.momentum = momentum
+        self.nesterov = nesterov
+
+    def createState(self, weights):
+        if not self.momentum:
+            return {}
+        return {'velocity': np.zeros_like(weights)}
+
+    def update(self, weights, gradient, state, learningRate):
+        gradient *= learningRate
+
+        if not self.momentum:
+            weights -= gradient
+            return
+
+        # velocity = momentum * velocity - learningRate * gradient
+        velocity = state['velocity']
+        velocity *= self.momentum
+        velocity -= gradient
+
+        if self.nesterov:
+            # weights += momentum * velocity - learningRate * gradient
+            gradient *= -1
+            gradient += self.momentum * velocity
+            weights += gradient
+        else:
+            weights += velocity
+
+
+class RMSprop(Optimizer):
+    """
+    Divide the gradient by a running average of its recent magnitude
+
+    Parameters
+    ----------
+    rho : float
+        decay rate of the running average of the squared gradient
+    epsilon : float
+        small constant for numerical stability
+    """
+    def __init__(self, rho=0.9, epsilon=1e-8):
+        self.rho = rho
+        self.epsilon = epsilon
+
+    def createState(self, weights):
+        return {'squareAverage': np.zeros_like(weights),
+                'scratch': np.zeros_like(weights)}
+
+    def update(self, weights, gradient, state, learningRate):
+        squareAverage = state['squareAverage']
+        scratch = state['scratch']
+
+        # squareAverage = rho * squareAverage + (1 - rho) * gradient^2
+        np.square(gradient, out=scratch)
+        scratch *= 1 - self.rho
+        squareAverage *= self.rho
+        squareAverage += scratch
+
+        # weights -= learningRate * gradient / (sqrt(squareAverage) + eps)
+        np.sqrt(squareAverage, out=scratch)
+        scratch += self.epsilon
+        gradient /= scratch
+        gradient *= learningRate
+        weights -= gradient
+
+
+class Adam(Optimizer):
+    """
+    Adaptive moment estimation (Kingma and Ba, 2014)
+
+    Parameters
+    ----------
+    beta1 : float
+        decay rate of the first moment estimate
+    beta2 : float
+        decay rate of the second moment estimate
+    epsilon : float
+        small constant for numerical stability
+    """
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def createState(self, weights):
+        return {'firstMoment': np.zeros_like(weights),
+                'secondMoment': np.zeros_like(weights),
+                'scratch': np.zeros_like(weights),
+                'step': np.zeros(())}
+
+    def update(self, weights, gradient, state, learningRate):
+        firstMoment = state['firstMoment']
+        secondMoment = state['secondMoment']
+        scratch = state['scratch']
+
+        state['step'] += 1
+        step = float(state['step'])
+
+        # firstMoment = beta1 * firstMoment + (1 - beta1) * gradient
+        np.multiply(gradient, 1 - self.beta1, out=scratch)
+        firstMoment *= self.beta1
+        firstMoment += scratch
+
+        # secondMoment = beta2 * secondMoment + (1 - beta2) * gradient^2
+        np.square(gradient, out=scratch)
+        scratch *= 1 - self.beta2
+        secondMoment *= self.beta2
+        secondMoment += scratch
+
+        # bias corrected step size
+        stepSize = (learningRate * np.sqrt(1 - self.beta2 ** step) /
+                    (1 - self.beta1 ** step))
+
+        # weights -= stepSize * firstMoment / (sqrt(secondMoment) + eps)
+        np.sqrt(secondMoment, out=scratch)
+        scratch += self.epsilon
+        np.divide(firstMoment, scratch, out=gradient)
+        gradient *= stepSize
+        weights -= gradient
+
+
+def getOptimizer(optimizer):
+    """
+    Returns the optimizer corresponding to the given string, optimizer
+    instances are returned as they are
+    """
+    if isinstance(optimizer, Optimizer):
+        return optimizer
+
+    if optimizer == 'sgd':
+        return SGD()
+    elif optimizer == 'momentum':
+        return SGD(momentum=0.9)
+    elif optimizer == 'nesterov':
+        return SGD(momentum=0.9, nesterov=True)
+    elif optimizer == 'rmsprop':
+        return RMSprop()
+    elif optimizer == 'adam':
+        return Adam()
+    else:
+        raise ValueError('Unknown optimizer: ' + str(optimizer))
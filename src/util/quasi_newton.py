@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Full-batch quasi-Newton minimization (L-BFGS) for smooth convex problems
+such as the logistic regression.
+"""
+
+import numpy as np
+
+
+class LBFGS(object):
+    """
+    Limited-memory BFGS (Nocedal and Wright, 2006, algorithm 7.5) with a
+    backtracking line search satisfying the Armijo condition
+
+    Parameters
+    ----------
+    memory : positive int
+        number of recent (step, gradient change) pairs approximating the
+        inverse Hessian
+    tolerance : float
+        stop when the largest absolute gradient entry is below tolerance
+    relativeTolerance : float
+        stop when the loss improved by less than relativeTolerance * |loss|
+    maxLineSearch : positive int
+        number of step halvings before the line search gives up; the
+        minimization then forgets the curvature pairs and retries with a
+        steepest descent step, it only stops if that fails as well
+
+    Attributes
+    ----------
+    history : list of dicts
+        one entry per iteration: iteration, loss, gradientNorm (max norm),
+        step (length of the accepted step), evaluations (loss/gradient
+        evaluations so far)
+    converged : bool
+    message : string
+        why the minimization stopped
+    """
+
+    def __init__(self, memory=10, tolerance=1e-5, relativeTolerance=1e-9,
+                 maxLineSearch=30):
+        self.memory = memory
+        self.tolerance = tolerance
+        self.relativeTolerance = relativeTolerance
+        self.maxLineSearch = maxLineSearch
+
+        self.history = []
+        self.converged = False
+        self.message = ''
+
+    def minimize(self, function, x, maxIterations=100, callback=None):
+        """
+        Minimize function starting at x
+
+        Parameters
+        ----------
+        function : callable
+            returns the loss and its gradient (same shape as x) at a point
+        x : ndarray
+            the starting point, not modified
+        maxIterations : positive int
+        callback : callable
+            called with every history entry
+
+        Returns
+        -------
+        ndarray :
+            the minimizer found
+        """
+        x = np.array(x, dtype=np.float64)
+        loss, gradient = function(x)
+        evaluations = 1
+
+        steps = []
+        gradientChanges = []
+        self.history = []
+        self.converged = False
+        self.message = 'maximal number of iterations reached'
+
+        for iteration in range(maxIterations):
+            if np.max(np.abs(gradient)) < self.tolerance:
+                self.converged = True
+                self.message = 'gradient below tolerance'
+                break
+
+            direction = -self._apply_inverse_hessian(gradient, steps,
+                                                     gradientChanges)
+            slope = np.dot(gradient.ravel(), direction.ravel())
+            if slope >= 0:
+                # not a descent direction (numerical trouble), restart with
+                # steepest descent
+                steps, gradientChanges = [], []
+                direction = -gradient
+                slope = -np.dot(gradient.ravel(), gradient.ravel())
+
+            accepted, count = self._line_search(function, x, loss, direction,
+                                                slope, 1.0 if steps else
+                                                self._first_step(gradient))
+            evaluations += count
+            if accepted is None and steps:
+                # the curvature pairs may describe the function badly here,
+                # restart with steepest descent
+                steps, gradientChanges = [], []
+                direction = -gradient
+                slope = -np.dot(gradient.ravel(), gradient.ravel())
+                accepted, count = self._line_search(
+                    function, x, loss, direction, slope,
+                    self._first_step(gradient))
+                evaluations += count
+            if accepted is None:
+                self.message = 'line search failed'
+                break
+            newX, newLoss, newGradient = accepted
+
+            step = newX - x
+            gradientChange = newGradient - gradient
+            # only keep pairs with positive curvature, the approximation
+            # stays positive definite
+            if np.dot(step.ravel(), gradientChange.ravel()) > 1e-10:
+                steps.append(step)
+                gradientChanges.append(gradientChange)
+                if len(steps) > self.memory:
+                    steps.pop(0)
+                    gradientChanges.pop(0)
+
+            improvement = loss - newLoss
+            x, loss, gradient = newX, newLoss, newGradient
+
+            entry = {'iteration': iteration + 1,
+                     'loss': float(loss),
+                     'gradientNorm': float(np.max(np.abs(gradient))),
+                     'step': float(np.sqrt(np.dot(step.ravel(),
+                                                  step.ravel()))),
+                     'evaluations': evaluations}
+            self.history.append(entry)
+            if callback is not None:
+                callback(entry)
+
+            if improvement <= self.relativeTolerance * max(abs(loss), 1.0):
+                self.converged = True
+                self.message = 'loss improvement below tolerance'
+                break
+
+        return x
+
+    @staticmethod
+    def _first_step(gradient):
+        # without curvature information keep the step short
+        return min(1.0, 1.0 / np.sum(np.abs(gradient)))
+
+    def _line_search(self, function, x, loss, direction, slope, stepSize):
+        """
+        Backtracking line search along direction starting with stepSize
+
+        Returns
+        -------
+        tuple :
+            (x, loss, gradient) of the accepted point, or None if no step
+            satisfied the Armijo condition
+        int :
+            number of function evaluations
+        """
+        for evaluation in range(self.maxLineSearch):
+            newX = x + stepSize * direction
+            newLoss, newGradient = function(newX)
+            if newLoss <= loss + 1e-4 * stepSize * slope:
+                return (newX, newLoss, newGradient), evaluation + 1
+            stepSize *= 0.5
+        return None, self.maxLineSearch
+
+    @staticmethod
+    def _apply_inverse_hessian(gradient, steps, gradientChanges):
+        """Two-loop recursion: the inverse Hessian approximation times the
+        gradient"""
+        q = gradient.copy()
+        alphas = []
+        rhos = []
+        for s, y in zip(reversed(steps), reversed(gradientChanges)):
+            rho = 1.0 / np.dot(y.ravel(), s.ravel())
+            alpha = rho * np.dot(s.ravel(), q.ravel())
+            q -= alpha * y
+            alphas.append(alpha)
+            rhos.append(rho)
+
+        if steps:
+            # scale of the initial approximation from the newest pair
+            s, y = steps[-1], gradientChanges[-1]
+            q *= np.dot(s.ravel(), y.ravel()) / np.dot(y.ravel(), y.ravel())
+
+        for (s, y), alpha, rho in zip(zip(steps, gradientChanges),
+                                      reversed(alphas), reversed(rhos)):
+            beta = rho * np.dot(y.ravel(), q.ravel())
+            q += (alpha - beta) * s
+
+        return q